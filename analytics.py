@@ -0,0 +1,214 @@
+# analytics.py
+# Over-by-over match analytics. A match's deliveries are held as NumPy columns
+# (one small array per field, in scoring order) and every chart is a vectorized
+# reduction over them: bincount per over for the Manhattan, cumsum for the worm,
+# reduceat between wickets for partnerships. The arrays are cached per match,
+# tagged with the Match.version they reflect; a read at any other version reloads
+# them, so edits and writes made by other workers are never served stale. The
+# worker that records a ball pushes it in place when the cache was current.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from models import db, Delivery
+
+EXTRAS_CODES = {"": 0, "WD": 1, "NB": 2, "B": 3, "LB": 4}
+OTHER_EXTRAS = 5
+ILLEGAL_CODES = (1, 2)  # wides and no-balls are not legal balls
+MAX_CACHED_MATCHES = 256
+
+FIELDS = (
+    ("id", np.int64), ("over", np.int16), ("ball", np.int16), ("runs", np.int16),
+    ("extras", np.int8), ("wicket", np.bool_), ("batting_team", np.int32),
+    ("striker", np.int32), ("non_striker", np.int32),
+)
+
+
+def _row(d):
+    # delivery_to_dict() output -> tuple in FIELDS order
+    return (
+        d["id"], d["over"] or 0, d["ball"] or 0, d["runs"] or 0,
+        EXTRAS_CODES.get(d["extras"] or "", OTHER_EXTRAS), bool(d["wicket"]),
+        d["batting_team_id"] or 0, d["striker_id"] or 0, d["non_striker_id"] or 0,
+    )
+
+
+class MatchArrays:
+    def __init__(self, capacity=256):
+        self.lock = threading.Lock()
+        self.size = 0
+        self.version = None  # Match.version these rows reflect
+        self.cols = {name: np.zeros(capacity, dtype=dt) for name, dt in FIELDS}
+
+    @classmethod
+    def from_rows(cls, rows):
+        # rows sorted by id, as _load_rows returns them
+        arrays = cls(max(256, len(rows)))
+        for (name, _), values in zip(FIELDS, zip(*rows)):
+            arrays.cols[name][:len(rows)] = values
+        arrays.size = len(rows)
+        return arrays
+
+    @property
+    def last_id(self):
+        return int(self.cols["id"][self.size - 1]) if self.size else 0
+
+    def view(self):
+        # consistent snapshot of the filled part
+        with self.lock:
+            return {name: col[:self.size].copy() for name, col in self.cols.items()}
+
+    def extend(self, rows):
+        # rows: tuples in FIELDS order; kept sorted by delivery id, duplicates ignored
+        with self.lock:
+            for row in rows:
+                did = row[0]
+                ids = self.cols["id"][:self.size]
+                if self.size and did <= ids[-1]:
+                    pos = int(np.searchsorted(ids, did))
+                    if pos < self.size and ids[pos] == did:
+                        continue
+                else:
+                    pos = self.size
+                if self.size == len(self.cols["id"]):
+                    for name in self.cols:
+                        self.cols[name] = np.resize(self.cols[name], 2 * self.size)
+                for (name, _), value in zip(FIELDS, row):
+                    col = self.cols[name]
+                    col[pos + 1:self.size + 1] = col[pos:self.size]
+                    col[pos] = value
+                self.size += 1
+
+
+_cache = OrderedDict()  # match_id -> MatchArrays
+_cache_lock = threading.Lock()
+
+
+def _load_rows(match_id, after_id=0):
+    q = db.session.query(
+        Delivery.id, Delivery.over, Delivery.ball_in_over, Delivery.runs, Delivery.extras,
+        Delivery.wicket, Delivery.batting_team_id, Delivery.striker_id, Delivery.non_striker_id,
+    ).filter(Delivery.match_id == match_id, Delivery.id > after_id).order_by(Delivery.id)
+    return [
+        (did, over or 0, ball or 0, runs or 0, EXTRAS_CODES.get(extras or "", OTHER_EXTRAS),
+         bool(wicket), bat or 0, striker or 0, non_striker or 0)
+        for did, over, ball, runs, extras, wicket, bat, striker, non_striker in q
+    ]
+
+
+def match_arrays(match_id, version):
+    # version: the Match.version read before the rows, so a reload can only be newer than its tag
+    with _cache_lock:
+        arrays = _cache.get(match_id)
+        if arrays is not None:
+            _cache.move_to_end(match_id)
+    if arrays is None or arrays.version != version:
+        arrays = MatchArrays.from_rows(_load_rows(match_id))
+        arrays.version = version
+        with _cache_lock:
+            _cache[match_id] = arrays
+            while len(_cache) > MAX_CACHED_MATCHES:
+                _cache.popitem(last=False)
+    return arrays
+
+
+def push_deliveries(match_id, deliveries, version):
+    # called after commit with delivery_to_dict() payloads and the Match.version that
+    # write produced; only an entry that was current just before it can be extended
+    with _cache_lock:
+        arrays = _cache.get(match_id)
+        if arrays is None:
+            return
+        if arrays.version != version - 1:
+            _cache.pop(match_id, None)
+            return
+    arrays.extend(_row(d) for d in deliveries)
+    arrays.version = version
+
+
+def invalidate(match_id):
+    with _cache_lock:
+        _cache.pop(match_id, None)
+
+
+def _overs_notation(legal_balls):
+    return f"{legal_balls // 6}.{legal_balls % 6}"
+
+
+def innings_analytics(cols, team_id, overs_limit):
+    mask = cols["batting_team"] == team_id
+    # rows stored before parse_delivery rejected negative overs count towards the first over
+    over = np.maximum(cols["over"][mask].astype(np.int64), 0)
+    runs = cols["runs"][mask].astype(np.int64)
+    wicket, striker, non_striker = cols["wicket"][mask], cols["striker"][mask], cols["non_striker"][mask]
+    legal = ~np.isin(cols["extras"][mask], ILLEGAL_CODES)
+    if not len(over):
+        return {"team_id": team_id, "runs": 0, "wickets": 0, "overs": "0.0", "legal_balls": 0,
+                "manhattan": [], "worm": [], "run_rate_by_over": [], "partnerships": [], "fall_of_wickets": []}
+
+    n_overs = int(over.max()) + 1
+    per_over = np.bincount(over, weights=runs, minlength=n_overs).astype(np.int64)
+    wickets_per_over = np.bincount(over, weights=wicket, minlength=n_overs).astype(np.int64)
+    legal_per_over = np.bincount(over, weights=legal, minlength=n_overs)
+    worm = np.cumsum(per_over)
+    balls_to_date = np.cumsum(legal_per_over)
+    rr_by_over = np.divide(worm * 6.0, balls_to_date, out=np.zeros(n_overs), where=balls_to_date > 0)
+
+    cum_runs = np.cumsum(runs)
+    cum_legal = np.cumsum(legal)
+    wicket_idx = np.flatnonzero(wicket)
+    fall = [
+        {"wicket": k + 1, "score": int(cum_runs[i]), "overs": _overs_notation(int(cum_legal[i])),
+         "player_id": int(striker[i]) or None}
+        for k, i in enumerate(wicket_idx)
+    ]
+
+    # partnerships run from the ball after one wicket to the ball that ends the next
+    starts = np.concatenate(([0], wicket_idx + 1))
+    starts = starts[starts < len(runs)]
+    p_runs = np.add.reduceat(runs, starts)
+    p_balls = np.add.reduceat(legal.astype(np.int64), starts)
+    partnerships = [
+        {"wicket": k + 1, "runs": int(r), "balls": int(b),
+         "batters": sorted({int(striker[s]), int(non_striker[s])} - {0})}
+        for k, (s, r, b) in enumerate(zip(starts, p_runs, p_balls))
+    ]
+
+    total_runs, legal_balls = int(cum_runs[-1]), int(cum_legal[-1])
+    return {
+        "team_id": team_id,
+        "runs": total_runs,
+        "wickets": int(wicket.sum()),
+        "overs": _overs_notation(legal_balls),
+        "legal_balls": legal_balls,
+        "run_rate": round(total_runs * 6.0 / legal_balls, 2) if legal_balls else 0.0,
+        "manhattan": [{"over": o + 1, "runs": int(r), "wickets": int(w)}
+                      for o, (r, w) in enumerate(zip(per_over, wickets_per_over))],
+        "worm": [int(x) for x in worm],
+        "run_rate_by_over": [round(float(x), 2) for x in rr_by_over],
+        "partnerships": partnerships,
+        "fall_of_wickets": fall,
+        "balls_remaining": max(0, overs_limit * 6 - legal_balls),
+    }
+
+
+def match_analytics(match_id, innings, version, overs_limit=20):
+    # innings: match_innings() output (ordered by innings), for the batting order
+    cols = match_arrays(match_id, version).view()
+    team_order = [i["batting_team_id"] for i in innings.values() if i.get("batting_team_id")]
+    for t in cols["batting_team"]:
+        if int(t) and int(t) not in team_order:
+            team_order.append(int(t))
+    result = [innings_analytics(cols, t, overs_limit) for t in team_order]
+
+    if len(result) >= 2:
+        chase = result[1]
+        target = result[0]["runs"] + 1
+        need = max(0, target - chase["runs"])
+        chase["target"] = target
+        chase["runs_required"] = need
+        left = chase["balls_remaining"]
+        chase["required_run_rate"] = round(need * 6.0 / left, 2) if left else None
+    return {"match_id": match_id, "overs_limit": overs_limit, "deliveries": int(len(cols["id"])),
+            "innings": result}
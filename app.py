@@ -1,19 +1,41 @@
 # app.py
+# Flask app factory: `flask --app app run`, or `gunicorn --preload 'app:create_app()'`.
+# Building an app touches no database and starts no threads, so workers can fork from
+# a preloaded master; create the schema with `flask --app app init-db` (db-upgrade).
+# numpy (analytics, simulate) is imported by the views that need it, the export
+# libraries by the export code, so a worker only pays for what it serves.
 import os
+import re
+import sys
 import json
-import io
 import datetime
 from flask import (
-    Flask, render_template, request, redirect, url_for, flash,
-    send_from_directory, send_file, jsonify
+    Flask, current_app, render_template, request, redirect, url_for, flash,
+    send_from_directory, send_file, jsonify, Response
 )
-from models import db, Tournament, Team, Player, Match, Delivery
-from utils import (
-    simple_scheduler, compute_points_and_nrr,
-    overs_to_balls, balls_to_overs,
-    top_batsmen_for_team, top_bowlers_for_team, match_score_summary
+from models import db, Tournament, Team, Player, Match, Delivery, create_schema, enable_sqlite_pragmas
+from scoring import (
+    record_delivery, match_innings, delivery_to_dict, latest_delivery_id,
+    parse_delivery, add_stat_deltas, apply_stat_deltas, existing_client_seqs, ingest_batch,
+    correct_delivery, expand_ball_by_ball, append_ball_event, ball_by_ball_list,
+    ball_event_deltas, correct_ball_event
 )
-import pandas as pd
+from live import get_hub, publish_delivery, publish_correction, stream_messages
+from scheduler import build_schedule, fixture_label
+from exports import ArtifactCache, export_file, EXPORT_FORMATS, MIMETYPES
+from jobs import ExportJobs
+from writer import WriteQueue
+from shards import init_shards
+from leaders import leaders, player_card, team_names, LeaderboardError
+from standings import (
+    points_table, bump_version, match_snapshot, apply_match_result, tournament_version
+)
+from httpcache import versioned, team_version, match_version, deploy_token
+from commands import register_commands
+from instrument import init_instrumentation
+from fragments import init_fragment_cache
+from utils import overs_to_balls, roster_names, invalidate_roster
+from sqlalchemy.exc import IntegrityError
 
 # ----------------------
 # Config & paths
@@ -22,27 +44,82 @@ import pandas as pd
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 STATIC_FILES = os.path.join(BASE_DIR, "static", "files")
-if not os.path.exists(STATIC_FILES):
-    os.makedirs(STATIC_FILES)
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(BASE_DIR, 'app.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'dev-secret-key'
 
-# initialize DB
-db.init_app(app)
-with app.app_context():
-    db.create_all()
+def default_config():
+    # read from the environment when an app is built, not at import
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, 'app.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': 'dev-secret-key',
+        'QUERY_COUNT_DEBUG': os.environ.get('QUERY_COUNT_DEBUG') == '1',
+        'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+        'QUERY_BUDGET': int(os.environ.get('QUERY_BUDGET', 50)),
+        # DB_MODE=production: WAL + tuned pragmas, delivery writes group-committed by one writer thread
+        'DB_MODE': os.environ.get('DB_MODE', 'default'),
+        'WRITE_BEHIND_MS': float(os.environ.get('WRITE_BEHIND_MS', 5)),
+        # conditional GETs (httpcache.py): 0 means proxies/browsers always revalidate
+        'HTTP_CACHE_MAX_AGE': int(os.environ.get('HTTP_CACHE_MAX_AGE', 0)),
+        'ETAG_SALT': os.environ.get('ETAG_SALT') or deploy_token(BASE_DIR),
+        # SHARD_DIR: one SQLite file per tournament there, DATABASE_URL becomes the catalog (shards.py)
+        'SHARD_DIR': os.environ.get('SHARD_DIR'),
+        'EXPORT_DIR': os.environ.get('EXPORT_DIR') or os.path.join(STATIC_FILES, "exports"),
+        'EXPORT_CACHE_MAX_BYTES': int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+        'EXPORT_WORKERS': int(os.environ.get('EXPORT_WORKERS', 2)),
+        # {% cache "name", key, version %} blocks in templates; 0 disables
+        'FRAGMENT_CACHE_MAX_BYTES': int(os.environ.get('FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    }
+
+
+# views are collected here and added to every app create_app() builds, under
+# their function names (url_for and the ETags depend on those endpoint names)
+ROUTES = []
+
+def route(rule, **options):
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+
+    db.init_app(app)
+    if app.config['DB_MODE'] == 'production':
+        with app.app_context():
+            enable_sqlite_pragmas(db.engine)
+    if app.config['SHARD_DIR']:
+        init_shards(app, app.config['SHARD_DIR'], read_only_endpoints=('start_export_job',))
+    register_commands(app)
+    metrics = init_instrumentation(app)
+
+    export_cache = ArtifactCache(app.config['EXPORT_DIR'], max_bytes=app.config['EXPORT_CACHE_MAX_BYTES'])
+    delivery_writes = WriteQueue(app, enabled=app.config['DB_MODE'] == 'production',
+                                 interval=app.config['WRITE_BEHIND_MS'] / 1000.0)
+    app.extensions['export_cache'] = export_cache
+    app.extensions['export_jobs'] = ExportJobs(app, export_cache, workers=app.config['EXPORT_WORKERS'])
+    app.extensions['delivery_writes'] = delivery_writes
+    metrics.collectors.append(delivery_writes.metric_lines)
+    fragment_cache = init_fragment_cache(app, app.config['FRAGMENT_CACHE_MAX_BYTES'])
+    if fragment_cache is not None:
+        metrics.collectors.append(fragment_cache.metric_lines)
+
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
 
 # ----------------------
 # Helper - serve uploaded/static files
 # ----------------------
-@app.route('/files/<path:filename>')
+@route('/files/<path:filename>')
 def files(filename):
     return send_from_directory(STATIC_FILES, filename)
 
-@app.route("/team/<int:team_id>/stats")
+@route("/team/<int:team_id>/stats")
+@versioned(team_version)
 def team_stats(team_id):
     team = Team.query.get_or_404(team_id)
     players = Player.query.filter_by(team_id=team_id).all()
@@ -57,38 +134,45 @@ def team_stats(team_id):
 # ----------------------
 # Home / index
 # ----------------------
-@app.route('/')
+@route('/')
 def index():
     tours = Tournament.query.order_by(Tournament.created_at.desc()).all()
     return render_template('index.html', tournaments=tours)
 
-@app.route('/tournament/create', methods=['POST'])
+@route('/tournament/create', methods=['POST'])
 def create_tournament():
     name = request.form.get('name') or f"Tournament {datetime.datetime.utcnow().isoformat()}"
     t = Tournament(name=name)
     db.session.add(t); db.session.commit()
+    router = current_app.extensions.get('shards')
+    if router is not None:
+        router.create_shard(t)
     flash("Tournament created", "success")
     return redirect(url_for('tournament_home', tid=t.id))
 
 # ----------------------
 # Tournament home (teams + matches)
 # ----------------------
-@app.route('/tournament/<int:tid>')
+@route('/tournament/<int:tid>')
+@versioned(tournament_version)
 def tournament_home(tid):
     tour = Tournament.query.get_or_404(tid)
     teams = Team.query.filter_by(tournament_id=tid).all()
     matches = Match.query.filter_by(tournament_id=tid).all()
-    # also compute points table for display (safe)
+    # cached points table, rebuilt only when the tournament changed; a bad stored
+    # result must not take the whole page down
     try:
-        table = compute_points_and_nrr(matches, teams)
+        table = points_table(tid)
     except Exception:
+        db.session.rollback()
+        current_app.logger.exception("points table for tournament %s failed", tid)
         table = []
     return render_template('tournament.html', tour=tour, teams=teams, matches=matches, table=table)
 
 # ----------------------
 # Manage teams & players
 # ----------------------
-@app.route('/tournament/<int:tid>/teams', methods=['GET','POST'])
+@route('/tournament/<int:tid>/teams', methods=['GET','POST'])
 def manage_teams(tid):
     tour = Tournament.query.get_or_404(tid)
     if request.method == 'POST':
@@ -102,6 +186,7 @@ def manage_teams(tid):
             file = request.files.get('logo')
             if file and file.filename:
                 safe_name = f"{int(datetime.datetime.utcnow().timestamp())}_{file.filename}"
+                os.makedirs(STATIC_FILES, exist_ok=True)
                 dest = os.path.join(STATIC_FILES, safe_name)
                 file.save(dest)
                 team.logo = safe_name
@@ -109,6 +194,7 @@ def manage_teams(tid):
             for p in players:
                 pl = Player(name=p, team_id=team.id)
                 db.session.add(pl)
+            bump_version(tid)
             db.session.commit()
             flash('Team created', 'success')
         return redirect(url_for('manage_teams', tid=tid))
@@ -116,22 +202,30 @@ def manage_teams(tid):
     teams = Team.query.filter_by(tournament_id=tid).all()
     return render_template('teams.html', tour=tour, teams=teams)
 
-@app.route('/team/<int:team_id>/delete', methods=['POST'])
+@route('/team/<int:team_id>/delete', methods=['POST'])
 def delete_team(team_id):
     team = Team.query.get_or_404(team_id)
     tid = team.tournament_id
-    db.session.delete(team); db.session.commit()
+    db.session.delete(team)
+    bump_version(tid)
+    db.session.commit()
+    invalidate_roster(team_id)
     flash('Team deleted', 'success')
     return redirect(url_for('manage_teams', tid=tid))
 
-@app.route('/team/<int:team_id>/add_player', methods=['POST'])
+@route('/team/<int:team_id>/add_player', methods=['POST'])
 def add_player(team_id):
     name = request.form.get('player_name')
     if not name:
         flash('Player name required', 'danger')
     else:
+        team = Team.query.get_or_404(team_id)
         p = Player(name=name, team_id=team_id)
-        db.session.add(p); db.session.commit()
+        db.session.add(p)
+        team.roster_version += 1
+        bump_version(team.tournament_id, standings_changed=False)
+        db.session.commit()
+        invalidate_roster(team_id)
         flash('Player added', 'success')
     team = Team.query.get_or_404(team_id)
     return redirect(url_for('manage_teams', tid=team.tournament_id))
@@ -139,20 +233,40 @@ def add_player(team_id):
 # ----------------------
 # Scheduler
 # ----------------------
-@app.route('/tournament/<int:tid>/schedule', methods=['POST'])
+@route('/tournament/<int:tid>/schedule', methods=['POST'])
 def schedule_matches(tid):
     tour = Tournament.query.get_or_404(tid)
-    teams = Team.query.filter_by(tournament_id=tid).all()
-    team_ids = [t.id for t in teams]
+    team_ids = [team_id for (team_id,) in db.session.query(Team.id).filter_by(tournament_id=tid).order_by(Team.id)]
     if len(team_ids) < 2:
         flash('Need at least 2 teams', 'danger')
         return redirect(url_for('tournament_home', tid=tid))
 
-    pairs = simple_scheduler(team_ids, matches_per_team=3)
-    created = 0
-    for a,b in pairs:
-        m = Match(tournament_id=tid, teamA_id=a, teamB_id=b)
-        db.session.add(m); created += 1
+    def form_int(key, default):
+        try:
+            return max(0, int(request.form.get(key, default)))
+        except (TypeError, ValueError):
+            return default
+
+    matches_per_team = form_int('matches_per_team', 3) or 3
+    rest_days = form_int('rest_days', 0)
+    days_between = form_int('days_between', 1) or 1
+    venues = [v.strip() for v in request.form.get('venues', '').split(',') if v.strip()]
+    start_date = request.form.get('start_date') or None
+    try:
+        fixture_label(0, start_date)
+    except ValueError:
+        flash('Invalid start date (use YYYY-MM-DD)', 'danger')
+        return redirect(url_for('tournament_home', tid=tid))
+
+    fixtures = build_schedule(team_ids, matches_per_team, venues=venues, rest_days=rest_days)
+    if fixtures:
+        db.session.execute(db.insert(Match), [
+            {"tournament_id": tid, "teamA_id": f.home, "teamB_id": f.away, "venue": f.venue,
+             "scheduled": fixture_label(f.day, start_date, days_between)}
+            for f in fixtures
+        ])
+    created = len(fixtures)
+    bump_version(tid, standings_changed=False)
     db.session.commit()
     flash(f"Scheduled {created} matches", "success")
     return redirect(url_for('tournament_home', tid=tid))
@@ -160,7 +274,8 @@ def schedule_matches(tid):
 # ----------------------
 # Matches list & simple recording
 # ----------------------
-@app.route('/tournament/<int:tid>/matches')
+@route('/tournament/<int:tid>/matches')
+@versioned(tournament_version)
 def matches(tid):
     tour = Tournament.query.get_or_404(tid)
     matches = Match.query.filter_by(tournament_id=tid).all()
@@ -168,7 +283,7 @@ def matches(tid):
     return render_template('matches.html', tour=tour, matches=matches, teams_map=teams_map)
 
 # Match details (keeps both naming styles for compatibility)
-@app.route('/match/<int:mid>/details')
+@route('/match/<int:mid>/details')
 def match_details(mid):
     m = Match.query.get_or_404(mid)
     teamA = Team.query.get(m.teamA_id) if m.teamA_id else None
@@ -184,9 +299,23 @@ def match_details(mid):
                            team1_players=playersA, team2_players=playersB)
 
 # Record quick match result (form)
-@app.route('/match/<int:mid>/record', methods=['POST'])
+PLAYER_FORM_KEY = re.compile(r'^p_(\d+)_(runs_conceded|overs_bowled|runs|balls|wickets)$')
+PLAYER_FORM_FIELDS = {
+    'runs': 'runs', 'balls': 'balls_faced', 'wickets': 'wickets',
+    'runs_conceded': 'runs_conceded', 'overs_bowled': 'balls_bowled',
+}
+# innings overs as "<overs>[.<balls>]"; anything else would break the points table
+OVERS_FORM = re.compile(r'^\d+(\.[0-5])?$')
+
+@route('/match/<int:mid>/record', methods=['POST'])
 def record_match(mid):
     m = Match.query.get_or_404(mid)
+    a_overs = (request.form.get('a_overs') or '0.0').strip()
+    b_overs = (request.form.get('b_overs') or '0.0').strip()
+    if not (OVERS_FORM.match(a_overs) and OVERS_FORM.match(b_overs)):
+        flash('Invalid overs (use overs.balls, e.g. 19.4)', 'danger')
+        return redirect(url_for('matches', tid=m.tournament_id))
+    before = match_snapshot(m)
     # parse safely
     def safe_int(val, default=0):
         try:
@@ -195,10 +324,10 @@ def record_match(mid):
             return default
 
     m.a_runs = safe_int(request.form.get('a_runs', 0))
-    m.a_overs = request.form.get('a_overs', '0.0') or '0.0'
+    m.a_overs = a_overs
     m.a_wickets = safe_int(request.form.get('a_wickets', 0))
     m.b_runs = safe_int(request.form.get('b_runs', 0))
-    m.b_overs = request.form.get('b_overs', '0.0') or '0.0'
+    m.b_overs = b_overs
     m.b_wickets = safe_int(request.form.get('b_wickets', 0))
 
     m.played = True
@@ -209,232 +338,238 @@ def record_match(mid):
     else:
         m.winner = 'tie'
 
-    # Update player stats from form inputs (if provided)
-    for pl in Player.query.join(Team).filter(Team.tournament_id == m.tournament_id).all():
-        r_key = f"p_{pl.id}_runs"
-        b_key = f"p_{pl.id}_balls"
-        w_key = f"p_{pl.id}_wickets"
-        rc_key = f"p_{pl.id}_runs_conceded"
-        ob_key = f"p_{pl.id}_overs_bowled"
-
-        if r_key in request.form:
-            pl.runs = (pl.runs or 0) + safe_int(request.form.get(r_key, 0))
-        if b_key in request.form:
-            # your code uses 'balls' for batting balls; models may use 'balls_faced' — ensure consistency
-            # we'll update both if they exist
-            val = safe_int(request.form.get(b_key, 0))
-            if hasattr(pl, 'balls'):
-                pl.balls = (pl.balls or 0) + val
-            if hasattr(pl, 'balls_faced'):
-                pl.balls_faced = (pl.balls_faced or 0) + val
-        if w_key in request.form:
-            pl.wickets = (pl.wickets or 0) + safe_int(request.form.get(w_key, 0))
-        if rc_key in request.form:
-            pl.runs_conceded = (pl.runs_conceded or 0) + safe_int(request.form.get(rc_key, 0))
-        if ob_key in request.form:
+    # Update player stats from form inputs (if provided): parse the p_<id>_<field>
+    # keys once, then touch only the referenced players of this tournament
+    deltas = {}
+    for key, val in request.form.items():
+        mt = PLAYER_FORM_KEY.match(key)
+        if not mt:
+            continue
+        pid, field = int(mt.group(1)), mt.group(2)
+        if field == 'overs_bowled':
             # convert overs string like "3.4" into balls and add
             try:
-                inc = overs_to_balls(request.form.get(ob_key, "0"))
-                pl.balls_bowled = (pl.balls_bowled or 0) + inc
+                inc = overs_to_balls(val or "0")
             except Exception:
-                pass
+                continue
+        else:
+            inc = safe_int(val)
+        if inc:
+            deltas.setdefault(pid, {})[PLAYER_FORM_FIELDS[field]] = inc
+
+    # claim the result against the version it was read at: of two submits racing on
+    # this match only the first applies its old -> new change, the other rolls back
+    claimed = db.session.execute(db.update(Match).where(Match.id == m.id, Match.version == before.version)
+                                 .values(version=Match.version + 1)).rowcount
+    if not claimed:
+        db.session.rollback()
+        flash('This match was updated meanwhile; check the result and resubmit', 'danger')
+        return redirect(url_for('matches', tid=m.tournament_id))
 
+    if deltas:
+        in_tournament = {pid for (pid,) in db.session.query(Player.id).join(Team).filter(
+            Team.tournament_id == m.tournament_id, Player.id.in_(deltas))}
+        apply_stat_deltas({pid: d for pid, d in deltas.items() if pid in in_tournament})
+
+    # fold this match's (new minus old) contribution into the cached points table
+    apply_match_result(m, before)
     db.session.commit()
     flash('Result recorded', 'success')
     return redirect(url_for('matches', tid=m.tournament_id))
 
 # ----------------------
-# Ball-by-ball API (append JSON to match.ball_by_ball and update players)
+# Ball-by-ball API (append-only BallEvent rows and update players)
 # ----------------------
-@app.route('/match/<int:mid>/b2b/add', methods=['POST'])
+BALL_APPEND_RETRIES = 5
+
+@route('/match/<int:mid>/b2b/add', methods=['POST'])
 def add_ball(mid):
     m = Match.query.get_or_404(mid)
     payload = request.get_json() or {}
+    tid = m.tournament_id
 
-    # ensure ball_by_ball stored as list
-    try:
-        bbb = json.loads(m.ball_by_ball or "[]")
-        if not isinstance(bbb, list):
-            bbb = []
-    except Exception:
-        bbb = []
-
-    # normalize payload keys (optional)
     # expected fields: over, ball_in_over, batting_team_id, bowling_team_id, batsman_id/striker_id, bowler_id, runs, extras, wicket, is_no_ball, extras_type
-    bbb.append(payload)
-    m.ball_by_ball = json.dumps(bbb)
+    # stored as an appended BallEvent row; matches still holding an old blob are expanded first
+    def write():
+        expand_ball_by_ball(db.session.get(Match, mid))
+        ball_count = append_ball_event(mid, payload)
 
-    # defensive parsing
-    batsman_id = payload.get("batsman_id") or payload.get("striker_id")
-    bowler_id = payload.get("bowler_id")
-    runs = 0
-    try:
-        runs = int(payload.get("runs", 0) or 0)
-    except Exception:
-        runs = 0
+        # batsman / bowler counters, same policy as corrections use (scoring.ball_event_deltas)
+        apply_stat_deltas(ball_event_deltas(payload))
 
-    # extras may be string type (like 'WD') or numeric extra-run count; keep both
-    extras = payload.get("extras", "")
-    extras_runs = 0
-    if isinstance(extras, (int, float)):
-        extras_runs = int(extras)
-    else:
-        # if extras value is numeric string, parse
-        if isinstance(extras, str) and extras.isdigit():
-            extras_runs = int(extras)
-
-    wicket = bool(payload.get("wicket", False))
-    is_no_ball = bool(payload.get("is_no_ball", False))
-    extras_type = payload.get("extras_type") or payload.get("extras_kind") or ""
-
-    # apply to batsman
-    if batsman_id:
-        batsman = Player.query.get(batsman_id)
-        if batsman:
-            batsman.runs = (batsman.runs or 0) + runs
-            # only increment batting ball for legal deliveries (not no-ball)
-            if not is_no_ball and extras_type not in ['WD']:
-                # some code uses 'balls' others use 'balls_faced' — update both if present
-                if hasattr(batsman, 'balls'):
-                    batsman.balls = (batsman.balls or 0) + 1
-                if hasattr(batsman, 'balls_faced'):
-                    batsman.balls_faced = (batsman.balls_faced or 0) + 1
-
-    # apply to bowler
-    if bowler_id:
-        bowler = Player.query.get(bowler_id)
-        if bowler:
-            # count runs conceded (runs + extras_runs)
-            bowler.runs_conceded = (bowler.runs_conceded or 0) + runs + extras_runs
-            # increment legal ball only if not wide or no-ball
-            if extras_type not in ['WD', 'NB'] and not is_no_ball:
-                bowler.balls_bowled = (bowler.balls_bowled or 0) + 1
-            if wicket:
-                bowler.wickets = (bowler.wickets or 0) + 1
+        bump_version(tid, standings_changed=False, match_id=mid)
+        return ball_count
 
+    # through the delivery writer, which serializes appends in production mode; otherwise
+    # a concurrent append that took the same seq loses on the unique index and retries
+    for _ in range(BALL_APPEND_RETRIES):
+        try:
+            ball_count = current_app.extensions['delivery_writes'].run(write)
+        except IntegrityError:
+            continue
+        return jsonify({"status": "ok", "ball_count": ball_count})
+    return jsonify({"status": "error", "message": "concurrent appends to this match, retry"}), 409
+
+@route('/match/<int:mid>/b2b/<int:seq>', methods=['PATCH', 'DELETE'])
+def correct_ball(mid, seq):
+    # seq is the 1-based position in the /b2b list; PATCH merges fields into that ball
+    m = Match.query.get_or_404(mid)
+    changes = None
+    if request.method == 'PATCH':
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict) or not changes:
+            return jsonify({"status": "error", "message": "expected an object of fields to change"}), 400
+    expand_ball_by_ball(m)
+    try:
+        ev = correct_ball_event(m.id, seq, changes)
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 404
+    bump_version(m.tournament_id, standings_changed=False, match_id=m.id)
     db.session.commit()
-    return jsonify({"status": "ok", "ball_count": len(bbb)})
+    if ev is None:
+        return jsonify({"status": "ok", "deleted": seq})
+    return jsonify({"status": "ok", "seq": seq, "ball": json.loads(ev.payload)})
+
+@route('/match/<int:mid>/b2b')
+def get_ball_by_ball(mid):
+    # compatibility read path: same list shape the ball_by_ball column used to hold
+    m = Match.query.get_or_404(mid)
+    return jsonify(ball_by_ball_list(m))
 
 # ----------------------
 # Scoreboard & leaderboards
 # ----------------------
-@app.route('/tournament/<int:tid>/scoreboard')
+@route('/tournament/<int:tid>/scoreboard')
+@versioned(tournament_version)
 def scoreboard(tid):
     tour = Tournament.query.get_or_404(tid)
-    teams = Team.query.filter_by(tournament_id=tid).all()
-    matches = Match.query.filter_by(tournament_id=tid).all()
-    table = compute_points_and_nrr(matches, teams)
-    players = Player.query.join(Team).filter(Team.tournament_id == tid).order_by(Player.runs.desc()).limit(20).all()
+    table = points_table(tid)
+    players = leaders(tid, 'runs', limit=20)[0]
     orange = players[0] if players else None
-    bowlers = Player.query.join(Team).filter(Team.tournament_id == tid).order_by(Player.wickets.desc()).limit(20).all()
+    bowlers = leaders(tid, 'wickets', limit=20)[0]
     purple = bowlers[0] if bowlers else None
     return render_template('scoreboard.html', tour=tour, table=table, players=players, orange=orange, purple=purple)
 
+@route('/api/tournament/<int:tid>/leaders')
+@versioned(tournament_version)
+def api_leaders(tid):
+    Tournament.query.get_or_404(tid)
+    try:
+        page, next_cursor, rank, threshold = leaders(
+            tid, request.args.get('metric', 'runs'),
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+            min_qualifier=request.args.get('min', type=int))
+    except LeaderboardError as e:
+        return jsonify({'status':'error', 'message': str(e)}), 400
+    names = team_names([p.team_id for p in page])
+    rows = []
+    for i, p in enumerate(page):
+        card = player_card(p)
+        card.update(rank=rank + i, team_name=names.get(p.team_id, ""))
+        rows.append(card)
+    return jsonify({
+        'status': 'ok',
+        'metric': request.args.get('metric', 'runs'),
+        'min': threshold,
+        'leaders': rows,
+        'next_cursor': next_cursor,
+    })
+
+@route('/api/tournament/<int:tid>/qualification')
+@versioned(tournament_version)
+def api_qualification(tid):
+    Tournament.query.get_or_404(tid)
+    from simulate import qualification_chances, http_simulations
+
+    # bigger or parallel runs belong to `flask simulate-qualification`, not a request worker
+    result = qualification_chances(tid, sims=http_simulations(request.args.get('sims', 100_000, type=int)),
+                                   top_n=request.args.get('top', 4, type=int), workers=1)
+    return jsonify({'status': 'ok', **result})
+
 # ----------------------
 # Export: Excel
 # ----------------------
-@app.route('/tournament/<int:tid>/export/excel')
+@route('/tournament/<int:tid>/export/excel')
 def export_excel(tid):
     tour = Tournament.query.get_or_404(tid)
-    teams_q = Team.query.filter_by(tournament_id=tid).all()
-    matches_q = Match.query.filter_by(tournament_id=tid).all()
-    players_q = Player.query.join(Team).filter(Team.tournament_id == tid).all()
-
-    teams = [{"Name": t.name, "Players": ", ".join([p.name for p in t.players])} for t in teams_q]
-
-    matches = []
-    for m in matches_q:
-        matches.append({
-            "MatchID": m.id,
-            "TeamA": Team.query.get(m.teamA_id).name if m.teamA_id else "",
-            "TeamB": Team.query.get(m.teamB_id).name if m.teamB_id else "",
-            "A_runs": m.a_runs, "A_overs": m.a_overs, "A_wkts": m.a_wickets,
-            "B_runs": m.b_runs, "B_overs": m.b_overs, "B_wkts": m.b_wickets,
-            "Played": m.played, "Winner": m.winner
-        })
-
-    players = []
-    for p in players_q:
-        econ = 0
-        if (p.balls_bowled or 0) > 0:
-            overs = (p.balls_bowled or 0) / 6.0
-            econ = round((p.runs_conceded or 0) / overs, 2) if overs > 0 else 0
-        players.append({
-            "Name": p.name,
-            "Team": p.team.name if p.team else "",
-            "Runs": p.runs or 0,
-            "Balls": getattr(p, 'balls', getattr(p, 'balls_faced', 0)) or 0,
-            "Wickets": p.wickets or 0,
-            "Economy": econ
-        })
-
-    df1 = pd.DataFrame(teams)
-    df2 = pd.DataFrame(matches)
-    df3 = pd.DataFrame(players)
-    out_path = os.path.join(STATIC_FILES, f"tournament_{tid}_export.xlsx")
-    with pd.ExcelWriter(out_path, engine="openpyxl") as writer:
-        df1.to_excel(writer, sheet_name="Teams", index=False)
-        df2.to_excel(writer, sheet_name="Matches", index=False)
-        df3.to_excel(writer, sheet_name="Players", index=False)
-
-    return send_from_directory(STATIC_FILES, os.path.basename(out_path), as_attachment=True)
+    path = export_file(current_app.extensions['export_cache'], tid, 'xlsx')
+    return send_file(path, as_attachment=True, download_name=f"tournament_{tid}_export.xlsx",
+                     mimetype=MIMETYPES['xlsx'])
 
 # ----------------------
 # Export: PDF
 # ----------------------
-@app.route('/tournament/<int:tid>/export/pdf')
+@route('/tournament/<int:tid>/export/pdf')
 def export_pdf(tid):
+    tour = Tournament.query.get_or_404(tid)
     try:
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet
-    except Exception:
+        path = export_file(current_app.extensions['export_cache'], tid, 'pdf')
+    except ImportError:
         flash("reportlab not installed", "danger")
         return redirect(url_for('scoreboard', tid=tid))
+    return send_file(path, download_name=f"tournament_{tid}.pdf", as_attachment=True, mimetype=MIMETYPES['pdf'])
 
-    tour = Tournament.query.get_or_404(tid)
-    teams_q = Team.query.filter_by(tournament_id=tid).all()
-    matches_q = Match.query.filter_by(tournament_id=tid).all()
-    players_q = Player.query.join(Team).filter(Team.tournament_id == tid).all()
-
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-
-    story.append(Paragraph(f"Tournament: {tour.name}", styles['Title']))
-    story.append(Spacer(1, 12))
+# ----------------------
+# Export: ball-by-ball Parquet
+# ----------------------
+@route('/tournament/<int:tid>/export/deliveries.parquet')
+def export_deliveries_parquet(tid):
+    Tournament.query.get_or_404(tid)
+    try:
+        path = export_file(current_app.extensions['export_cache'], tid, 'parquet')
+    except ImportError:
+        return jsonify({'status':'error', 'message': 'pyarrow not installed'}), 501
+    return send_file(path, as_attachment=True, download_name=f"tournament_{tid}_deliveries.parquet",
+                     mimetype=MIMETYPES['parquet'])
 
-    # Points table
-    teams = Team.query.filter_by(tournament_id=tid).all()
-    table_data = [["Team","P","W","L","T","Pts","RF","RA","NRR"]]
-    table_rows = compute_points_and_nrr(matches_q, teams)
-    for r in table_rows:
-        table_data.append([r['team_name'], r['played'], r['won'], r['lost'], r['tied'], r['points'], r['runs_for'], r['runs_against'], r['nrr']])
-    t = Table(table_data)
-    t.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.5,colors.grey), ('BACKGROUND',(0,0),(-1,0),colors.lightgrey)]))
-    story.append(t)
-    story.append(Spacer(1, 12))
-
-    # Top players
-    story.append(Paragraph("Top Players", styles['Heading2']))
-    pdata = [["Player","Team","Runs","Wickets"]]
-    for p in players_q[:20]:
-        pdata.append([p.name, p.team.name if p.team else '', p.runs or 0, p.wickets or 0])
-    tp = Table(pdata)
-    tp.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.3,colors.grey),('BACKGROUND',(0,0),(-1,0),colors.lightgrey)]))
-    story.append(tp)
-
-    doc.build(story)
-    buffer.seek(0)
-    return send_file(buffer, download_name=f"tournament_{tid}.pdf", as_attachment=True, mimetype='application/pdf')
+# ----------------------
+# Export jobs (build in the background, poll, download)
+# ----------------------
+def _job_json(job):
+    return {
+        'job_id': job['id'], 'status': job['status'], 'error': job['error'],
+        'tournament_id': job['tournament_id'], 'format': job['format'], 'version': job['version'],
+        'status_url': url_for('export_job_status', job_id=job['id']),
+        'download_url': url_for('export_job_download', job_id=job['id']),
+    }
+
+@route('/tournament/<int:tid>/export/<fmt>', methods=['POST'])
+def start_export_job(tid, fmt):
+    Tournament.query.get_or_404(tid)
+    fmt = EXPORT_FORMATS.get(fmt)
+    if fmt is None:
+        return jsonify({'status':'error', 'message': 'unknown export format'}), 404
+    job = current_app.extensions['export_jobs'].submit(tid, fmt)
+    return jsonify(_job_json(job)), (200 if job['status'] == 'done' else 202)
+
+@route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    job = current_app.extensions['export_jobs'].get(job_id)
+    if job is None:
+        return jsonify({'status':'error', 'message': 'unknown job'}), 404
+    return jsonify(_job_json(job))
+
+@route('/export/jobs/<job_id>/download')
+def export_job_download(job_id):
+    job = current_app.extensions['export_jobs'].get(job_id)
+    if job is None:
+        return jsonify({'status':'error', 'message': 'unknown job'}), 404
+    if job['status'] != 'done':
+        return jsonify(_job_json(job)), 409
+    path = current_app.extensions['export_cache'].get(job['tournament_id'], job['format'], job['version'])
+    if path is None:
+        # evicted from the cache since; the client should start a new job
+        return jsonify({'status':'error', 'message': 'export expired, start a new job'}), 410
+    return send_file(path, as_attachment=True, mimetype=MIMETYPES[job['format']],
+                     download_name=f"tournament_{job['tournament_id']}.{job['format']}")
 
 # -------------------------
 # Live scoring UI + APIs
 # -------------------------
 
-@app.route('/live/<int:match_id>')
+@route('/live/<int:match_id>')
 def live_score_page(match_id):
     m = Match.query.get_or_404(match_id)
     # try to toggle live flag
@@ -446,8 +581,11 @@ def live_score_page(match_id):
 
     teamA = Team.query.get(m.teamA_id) if m.teamA_id else None
     teamB = Team.query.get(m.teamB_id) if m.teamB_id else None
-    team1_players = Player.query.filter_by(team_id=m.teamA_id).all() if m.teamA_id else []
-    team2_players = Player.query.filter_by(team_id=m.teamB_id).all() if m.teamB_id else []
+    # full Player rows: the page shows their stats, which the roster cache does not hold
+    players = Player.query.filter(Player.team_id.in_([t for t in (m.teamA_id, m.teamB_id) if t])) \
+        .order_by(Player.id).all()
+    team1_players = [p for p in players if p.team_id == m.teamA_id]
+    team2_players = [p for p in players if p.team_id == m.teamB_id]
 
     return render_template('live_score.html',
                            match=m, m=m,
@@ -456,66 +594,181 @@ def live_score_page(match_id):
                            team1_players=team1_players, team2_players=team2_players,
                            playersA=team1_players, playersB=team2_players)
 
-@app.route('/api/match/<int:match_id>/delivery', methods=['POST'])
+# the per-match column cache lives in analytics.py (numpy); a worker that has not
+# served an analytics request has nothing cached, so writes never import it
+def warm_analytics(match_id, deltas, version):
+    analytics = sys.modules.get('analytics')
+    if analytics is not None and deltas:
+        analytics.push_deliveries(match_id, deltas, version)
+
+def drop_analytics(match_id):
+    analytics = sys.modules.get('analytics')
+    if analytics is not None:
+        analytics.invalidate(match_id)
+
+@route('/api/match/<int:match_id>/delivery', methods=['POST'])
 def post_delivery(match_id):
     data = request.json or {}
     match = Match.query.get_or_404(match_id)
-    # create Delivery object
     try:
-        d = Delivery(
-            match_id = match_id,
-            over = int(data.get('over', 0)),
-            ball_in_over = int(data.get('ball_in_over', 1)),
-            batting_team_id = int(data.get('batting_team_id')) if data.get('batting_team_id') else None,
-            bowling_team_id = int(data.get('bowling_team_id')) if data.get('bowling_team_id') else None,
-            striker_id = int(data.get('striker_id')) if data.get('striker_id') else None,
-            non_striker_id = int(data.get('non_striker_id')) if data.get('non_striker_id') else None,
-            bowler_id = int(data.get('bowler_id')) if data.get('bowler_id') else None,
-            runs = int(data.get('runs', 0)),
-            extras = data.get('extras', ''),
-            wicket = bool(data.get('wicket', False)),
-            wicket_type = data.get('wicket_type', '')
-        )
+        d = parse_delivery(match_id, data)
     except Exception as e:
         return jsonify({'status':'error', 'message': f'invalid payload: {e}'}), 400
 
-    db.session.add(d)
-
-    # update player stats (simple policy)
-    if d.striker_id:
-        striker = Player.query.get(d.striker_id)
-        if striker:
-            if d.extras not in ['WD', 'NB']:
-                # update both 'balls' and 'balls_faced' if present
-                if hasattr(striker, 'balls'):
-                    striker.balls = (striker.balls or 0) + 1
-                if hasattr(striker, 'balls_faced'):
-                    striker.balls_faced = (striker.balls_faced or 0) + 1
-            striker.runs = (striker.runs or 0) + (d.runs or 0)
-
-    if d.bowler_id:
-        bowler = Player.query.get(d.bowler_id)
-        if bowler:
-            if d.extras not in ['WD', 'NB']:
-                bowler.balls_bowled = (bowler.balls_bowled or 0) + 1
-            bowler.runs_conceded = (bowler.runs_conceded or 0) + (d.runs or 0)
-            if d.wicket:
-                bowler.wickets = (bowler.wickets or 0) + 1
+    tid = match.tournament_id
 
-    db.session.commit()
-    return jsonify({'status':'ok'})
+    def write():
+        # a retried ball with a known client_seq is acknowledged, not re-applied
+        if d.client_seq is not None:
+            seen = existing_client_seqs(match_id, [d.client_seq])
+            if seen:
+                return seen[d.client_seq], None, None, None
+
+        db.session.add(d)
+        db.session.flush()
+        # keep the innings aggregate in the same transaction as the ball itself
+        agg = record_delivery(d)
+
+        # update player stats (simple policy)
+        apply_stat_deltas(add_stat_deltas({}, d))
+
+        bump_version(tid, standings_changed=False, match_id=match_id)
+
+        # serialize before commit expires the instances
+        return d.id, delivery_to_dict(d), agg.to_dict(), match_version(match_id)
+
+    delivery_id, delta, innings, version = current_app.extensions['delivery_writes'].run(write)
+    if delta is None:
+        return jsonify({'status':'ok', 'id': delivery_id, 'duplicate': True})
+    publish_delivery(match_id, delta, innings)
+    warm_analytics(match_id, [delta], version)
+    return jsonify({'status':'ok', 'id': delivery_id})
 
-@app.route('/api/match/<int:match_id>/score')
+@route('/api/match/<int:match_id>/deliveries:batch', methods=['POST'])
+def post_deliveries_batch(match_id):
+    match = Match.query.get_or_404(match_id)
+    data = request.get_json(silent=True)
+    items = data.get('deliveries') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'status':'error', 'message': 'expected a non-empty list of deliveries'}), 400
+
+    # validate everything before writing anything
+    parsed, errors, seen_seqs = [], [], set()
+    for i, item in enumerate(items):
+        try:
+            d = parse_delivery(match_id, item)
+        except Exception as e:
+            errors.append({'index': i, 'message': f'invalid payload: {e}'})
+            continue
+        if d.client_seq is None:
+            errors.append({'index': i, 'message': 'client_seq is required for batch ingestion'})
+        elif d.client_seq in seen_seqs:
+            errors.append({'index': i, 'message': f'duplicate client_seq {d.client_seq} in batch'})
+        else:
+            seen_seqs.add(d.client_seq)
+            parsed.append(d)
+    if errors:
+        return jsonify({'status':'error', 'errors': errors}), 400
+
+    tid = match.tournament_id
+
+    def write():
+        already = existing_client_seqs(match_id, [d.client_seq for d in parsed])
+        fresh = [d for d in parsed if d.client_seq not in already]
+        inserted, innings = ingest_batch(match_id, fresh)
+        if inserted:
+            bump_version(tid, standings_changed=False, match_id=match_id)
+        return already, [delivery_to_dict(d) for d in inserted], \
+            {team_id: agg.to_dict() for team_id, agg in innings.items()}, match_version(match_id)
+
+    try:
+        already, deltas, innings, version = current_app.extensions['delivery_writes'].run(write)
+    except IntegrityError:
+        # a concurrent retry of the same batch won the race; the client can safely resend
+        return jsonify({'status':'error', 'message': 'conflicting concurrent upload, retry'}), 409
+
+    for delta in deltas:
+        publish_delivery(match_id, delta, innings[delta['batting_team_id']])
+    warm_analytics(match_id, deltas, version)
+    return jsonify({
+        'status': 'ok',
+        'inserted': len(deltas),
+        'duplicates': sorted(already),
+        'ids': [d['id'] for d in deltas],
+    })
+
+@route('/api/match/<int:match_id>/delivery/<int:delivery_id>', methods=['PATCH', 'DELETE'])
+def correct_delivery_api(match_id, delivery_id):
+    # edit (PATCH with the fields to change) or delete one ball; its innings is replayed
+    # from the last over checkpoint before it and the player counters are adjusted
+    match = Match.query.get_or_404(match_id)
+    changes = None
+    if request.method == 'PATCH':
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict) or not changes:
+            return jsonify({'status':'error', 'message': 'expected an object of fields to change'}), 400
+
+    tid = match.tournament_id
+
+    def write():
+        d = Delivery.query.filter_by(id=delivery_id, match_id=match_id).first()
+        if d is None:
+            return None
+        innings = correct_delivery(d, changes)
+        bump_version(tid, standings_changed=False, match_id=match_id)
+        return None if changes is None else delivery_to_dict(d), \
+            {str(team_id): agg.to_dict() if agg is not None else None for team_id, agg in innings.items()}
+
+    try:
+        result = current_app.extensions['delivery_writes'].run(write)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status':'error', 'message': f'invalid payload: {e}'}), 400
+    if result is None:
+        return jsonify({'status':'error', 'message': 'delivery not found'}), 404
+    delivery, innings = result
+
+    # the cached columns and the live stream both hold the old ball
+    drop_analytics(match_id)
+    publish_correction(match_id, lambda: match_innings(match_id))
+    body = {'status': 'ok', 'id': delivery_id, 'innings': innings}
+    if delivery is None:
+        body['deleted'] = True
+    else:
+        body['delivery'] = delivery
+    return jsonify(body)
+
+@route('/api/match/<int:match_id>/stream')
+def api_stream(match_id):
+    Match.query.get_or_404(match_id)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    hub = get_hub(match_id, loader=lambda: (match_innings(match_id), latest_delivery_id(match_id)))
+    sub, first = hub.subscribe(last_event_id)
+    heartbeat = current_app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+    return Response(stream_messages(hub, sub, first, heartbeat), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/api/match/<int:match_id>/score')
+@versioned(match_version)
 def api_get_score(match_id):
-    summary = match_score_summary(match_id)
+    # score comes from the maintained innings aggregates; only the recent balls are read
+    score = match_innings(match_id)
+    recent = Delivery.query.filter_by(match_id=match_id) \
+        .order_by(Delivery.created_at.desc(), Delivery.id.desc()).limit(50).all()
+
+    names = roster_names(match_id, [pid for d in recent for pid in (d.striker_id, d.bowler_id)])
 
     deliveries_json = []
-    for d in summary.get('deliveries', [])[-50:]:
+    for d in reversed(recent):
         deliveries_json.append({
             'over': d.over,
             'ball': d.ball_in_over,
-            'batsman': Player.query.get(d.striker_id).name if d.striker_id else "",
-            'bowler': Player.query.get(d.bowler_id).name if d.bowler_id else "",
+            'batsman': names.get(d.striker_id, "") if d.striker_id else "",
+            'bowler': names.get(d.bowler_id, "") if d.bowler_id else "",
             'runs': d.runs,
             'extras': d.extras,
             'wicket': d.wicket,
@@ -524,13 +777,27 @@ def api_get_score(match_id):
 
     return jsonify({
         'status': 'ok',
-        'score': summary.get('score', {}),
+        'score': score,
         'deliveries': deliveries_json
     })
 
+@route('/api/match/<int:match_id>/analytics')
+@versioned(match_version)
+def api_match_analytics(match_id):
+    from analytics import match_analytics
+
+    m = Match.query.get_or_404(match_id)
+    overs = request.args.get('overs', type=int) or m.tournament.settings_dict().get('overs') or 20
+    # m.version is read before the rows, so the cached arrays are never older than their tag
+    return jsonify({'status': 'ok', **match_analytics(match_id, match_innings(match_id), m.version,
+                                                      overs_limit=int(overs))})
+
 # -------------------------
 # App entrypoint
 # -------------------------
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        create_schema()  # a fresh checkout runs without a separate init-db
     app.run(debug=True)
@@ -0,0 +1,2 @@
+# bench
+# Benchmark suite: `python -m bench --help`; worker startup: `python -m bench.startup --help`
@@ -0,0 +1,219 @@
+# bench/runner.py
+# Times the hot paths against a generated tournament in a throwaway SQLite database
+# and reports latency percentiles and SQL statement counts per operation as JSON.
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the page templates are not needed to measure the data work behind a page; these
+# trivial ones are only used when the app's own templates cannot be found
+FALLBACK_TEMPLATES = {
+    name: "{{ tour.name if tour is defined else '' }}"
+    for name in ("tournament.html", "scoreboard.html", "matches.html", "match_details.html",
+                 "team_stats.html", "teams.html", "index.html", "live_score.html")
+}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(samples_ms, queries):
+    return {
+        "n": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p90_ms": round(percentile(samples_ms, 90), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "queries_per_call": round(sum(queries) / len(queries), 2),
+    }
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._hit)
+
+    def _hit(self, *args):
+        self.count += 1
+
+
+def _run_scenarios(scenarios, counter, results):
+    for name, fn, n in scenarios:
+        samples, queries, statuses = [], [], set()
+        fn()  # warm-up (caches, first-use imports)
+        for _ in range(n):
+            before = counter.count
+            start = time.perf_counter()
+            resp = fn()
+            samples.append((time.perf_counter() - start) * 1000)
+            queries.append(counter.count - before)
+            if resp is not None and hasattr(resp, "status_code"):
+                statuses.add(resp.status_code)
+                resp.close()
+        results[name] = summarize(samples, queries)
+        if statuses:
+            results[name]["statuses"] = sorted(statuses)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def run(teams=20, players_per_team=15, deliveries=50_000, iterations=50, export_iterations=5, seed=7,
+        db_mode="default"):
+    workdir = tempfile.mkdtemp(prefix="crick-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.db")
+    os.environ["EXPORT_DIR"] = os.path.join(workdir, "exports")
+    os.environ["DB_MODE"] = db_mode
+    sys.path.insert(0, ROOT)
+
+    from app import create_app
+    from jinja2 import ChoiceLoader, DictLoader
+    from models import db, Team, Player, Match, create_schema
+    from synthetic import generate_tournament
+    from standings import bump_version
+    from utils import compute_points_and_nrr, simple_scheduler
+
+    flask_app = create_app()
+    flask_app.jinja_env.loader = ChoiceLoader([flask_app.jinja_env.loader, DictLoader(FALLBACK_TEMPLATES)])
+    client = flask_app.test_client()
+    rng = random.Random(seed)
+
+    with flask_app.app_context():
+        create_schema()
+        start = time.perf_counter()
+        dataset = generate_tournament(teams=teams, players_per_team=players_per_team,
+                                      deliveries=deliveries, seed=seed)
+        dataset["generate_seconds"] = round(time.perf_counter() - start, 2)
+        tid = dataset["tournament_id"]
+        counter = QueryCounter(db.engine)
+
+        team_ids = [t for (t,) in db.session.query(Team.id).filter_by(tournament_id=tid).order_by(Team.id)]
+        played = db.session.query(Match.id, Match.teamA_id, Match.teamB_id) \
+            .filter_by(tournament_id=tid, played=True).all()
+        # a fresh fixture to score live balls into
+        live = Match(tournament_id=tid, teamA_id=team_ids[0], teamB_id=team_ids[1])
+        db.session.add(live)
+        db.session.commit()
+        live_id = live.id
+        roster = {t: [p for (p,) in db.session.query(Player.id).filter_by(team_id=t).order_by(Player.id)]
+                  for t in team_ids[:2]}
+        all_players = {t: [p for (p,) in db.session.query(Player.id).filter_by(team_id=t)] for t in team_ids}
+        db.session.remove()
+
+    ball = {"n": 0}
+
+    def post_delivery():
+        n = ball["n"]
+        ball["n"] += 1
+        over, b = divmod(n, 6)
+        return client.post(f"/api/match/{live_id}/delivery", json={
+            "over": over, "ball_in_over": b + 1,
+            "batting_team_id": team_ids[0], "bowling_team_id": team_ids[1],
+            "striker_id": roster[team_ids[0]][n % 2], "non_striker_id": roster[team_ids[0]][(n + 1) % 2],
+            "bowler_id": roster[team_ids[1]][-1 - over % 5], "runs": rng.choice((0, 1, 1, 2, 4, 6)),
+        })
+
+    def record_match():
+        mid, a, b = rng.choice(played)
+        form = {"a_runs": rng.randint(120, 220), "a_overs": "20.0", "a_wickets": rng.randint(2, 10),
+                "b_runs": rng.randint(120, 220), "b_overs": "20.0", "b_wickets": rng.randint(2, 10)}
+        for pid in all_players[a][:11] + all_players[b][:11]:
+            form[f"p_{pid}_runs"] = rng.randint(0, 40)
+            form[f"p_{pid}_balls"] = rng.randint(0, 30)
+        return client.post(f"/match/{mid}/record", data=form)
+
+    def fresh_export(path):
+        # a new data version, so the export is built rather than served from the cache
+        def call():
+            with flask_app.app_context():
+                bump_version(tid, standings_changed=False)
+                db.session.commit()
+                db.session.remove()
+            return client.get(path)
+        return call
+
+    def direct(fn):
+        def call():
+            with flask_app.app_context():
+                fn()
+                db.session.remove()
+        return call
+
+    def points_from_scratch():
+        matches = Match.query.filter_by(tournament_id=tid).all()
+        teams_q = Team.query.filter_by(tournament_id=tid).all()
+        compute_points_and_nrr(matches, teams_q)
+
+    scenarios = [
+        ("post_delivery", post_delivery, iterations),
+        ("api_get_score", lambda: client.get(f"/api/match/{live_id}/score"), iterations),
+        ("scoreboard", lambda: client.get(f"/tournament/{tid}/scoreboard"), iterations),
+        ("tournament_home", lambda: client.get(f"/tournament/{tid}"), iterations),
+        ("record_match", record_match, iterations),
+        ("compute_points_and_nrr", direct(points_from_scratch), iterations),
+        ("simple_scheduler", lambda: simple_scheduler(list(range(1, 1001)), matches_per_team=3), iterations),
+        ("export_excel", fresh_export(f"/tournament/{tid}/export/excel"), export_iterations),
+        ("export_pdf", fresh_export(f"/tournament/{tid}/export/pdf"), export_iterations),
+    ]
+
+    results = {}
+    try:
+        _run_scenarios(scenarios, counter, results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "db_mode": db_mode,
+        "dataset": dataset,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m bench",
+                                     description="Benchmark the hot paths on a generated tournament")
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--players-per-team", type=int, default=15)
+    parser.add_argument("--deliveries", type=int, default=50_000)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--export-iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--db-mode", choices=("default", "production"), default="default")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(teams=args.teams, players_per_team=args.players_per_team, deliveries=args.deliveries,
+                 iterations=args.iterations, export_iterations=args.export_iterations, seed=args.seed,
+                 db_mode=args.db_mode)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
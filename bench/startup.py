@@ -0,0 +1,111 @@
+# bench/startup.py
+# Worker startup cost: importing the app and building it with create_app(), the
+# first request, and peak RSS, each measured in a fresh interpreter against a
+# throwaway database. Reports which heavy libraries were loaded by then; any of them
+# showing up fails the run, as does going over --max-startup-ms / --max-rss-mb.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from statistics import median
+
+from bench.runner import ROOT, _git_revision
+
+# only the views / exports that need them may import these
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow", "openpyxl", "reportlab")
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+built = time.perf_counter()
+rss_built = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+resp = app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (built - imported) * 1000,
+    "first_request_ms": (done - built) * 1000,
+    "status": resp.status_code,
+    "rss_kb": rss_built,
+    "rss_after_request_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded": sorted(m for m in json.loads(sys.argv[2]) if m in sys.modules),
+}))
+"""
+
+
+def _probe(env, path):
+    out = subprocess.check_output([sys.executable, "-c", PROBE, path, json.dumps(HEAVY_MODULES)],
+                                  cwd=ROOT, env=env)
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def run(repeat=5, path="/api/match/1/score", max_startup_ms=None, max_rss_mb=None):
+    workdir = tempfile.mkdtemp(prefix="crick-startup-")
+    env = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(workdir, "startup.db"),
+               EXPORT_DIR=os.path.join(workdir, "exports"), PYTHONDONTWRITEBYTECODE="1")
+    try:
+        subprocess.check_call([sys.executable, "-m", "flask", "--app", "app", "init-db"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL)
+        _probe(env, path)  # warm-up: bytecode and OS file caches
+        samples = [_probe(env, path) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # ru_maxrss is in KiB on Linux
+    startup = [s["import_ms"] + s["create_app_ms"] for s in samples]
+    rss_mb = max(s["rss_kb"] for s in samples) / 1024.0
+    loaded = sorted({m for s in samples for m in s["loaded"]})
+    failures = [f"{m} imported at startup" for m in loaded]
+    if max_startup_ms is not None and median(startup) > max_startup_ms:
+        failures.append(f"startup {median(startup):.1f} ms > {max_startup_ms} ms")
+    if max_rss_mb is not None and rss_mb > max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB > {max_rss_mb} MB")
+
+    return {
+        "revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "import_ms": round(median(s["import_ms"] for s in samples), 2),
+        "create_app_ms": round(median(s["create_app_ms"] for s in samples), 2),
+        "startup_ms": round(median(startup), 2),
+        "first_request": {"path": path, "status": samples[0]["status"],
+                          "ms": round(median(s["first_request_ms"] for s in samples), 2)},
+        "rss_mb": round(rss_mb, 1),
+        "rss_after_request_mb": round(max(s["rss_after_request_kb"] for s in samples) / 1024.0, 1),
+        "heavy_modules_loaded": loaded,
+        "failures": failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.startup",
+                                     description="Measure app import / create_app() time and RSS per worker")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to sample (median is reported)")
+    parser.add_argument("--path", default="/api/match/1/score", help="First request to time")
+    parser.add_argument("--max-startup-ms", type=float, default=None, help="Fail above this import + create_app time")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="Fail above this peak RSS after create_app")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(repeat=args.repeat, path=args.path, max_startup_ms=args.max_startup_ms,
+                 max_rss_mb=args.max_rss_mb)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if report["failures"]:
+        for failure in report["failures"]:
+            print(f"startup regression: {failure}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
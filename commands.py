@@ -0,0 +1,203 @@
+# commands.py
+# Maintenance commands, run with `flask --app app <command>`
+import json
+import os
+import tempfile
+import click
+from flask import Flask, current_app
+from models import db, Team, Match, create_schema
+from scoring import rebuild_innings, expand_ball_by_ball
+from shards import tid_for_id
+from standings import bump_match_version
+
+
+def _scopes(tid=None):
+    # with per-tournament shards, run the body once per shard (or just tid's);
+    # otherwise once against the single database
+    router = current_app.extensions.get("shards")
+    if router is None:
+        yield None
+        return
+    for shard_tid in [tid] if tid is not None else router.tids():
+        with router.use(shard_tid):
+            yield shard_tid
+        db.session.remove()
+
+
+def register_commands(app):
+
+    @app.cli.command("rebuild-aggregates")
+    @click.option("--match-id", type=int, default=None, help="Only this match (default: all matches)")
+    @click.option("--check", is_flag=True, help="Report mismatches against the Delivery log without writing")
+    def rebuild_aggregates(match_id, check):
+        """Rebuild innings aggregates from the Delivery log."""
+        checked = total = 0
+        for _ in _scopes(tid_for_id(match_id) if match_id else None):
+            if match_id:
+                match_ids = [match_id]
+            else:
+                match_ids = [mid for (mid,) in db.session.query(Match.id).order_by(Match.id).all()]
+
+            for mid in match_ids:
+                mismatches = rebuild_innings(mid, check_only=check)
+                if mismatches and not check:
+                    bump_match_version(mid)
+                for mm in mismatches:
+                    click.echo(json.dumps(mm, default=str))
+                total += len(mismatches)
+            checked += len(match_ids)
+            if not check:
+                db.session.commit()
+        verb = "found" if check else "fixed"
+        click.echo(f"{checked} matches checked, {total} innings mismatches {verb}")
+        if check and total:
+            raise SystemExit(1)
+
+    @app.cli.command("expand-ball-by-ball")
+    def expand_ball_by_ball_command():
+        """One-off migration of Match.ball_by_ball JSON blobs into BallEvent rows."""
+        moved = expanded = 0
+        for _ in _scopes():
+            matches = Match.query.filter(Match.ball_by_ball.isnot(None), Match.ball_by_ball != "[]",
+                                         Match.ball_by_ball != "").all()
+            for m in matches:
+                moved += expand_ball_by_ball(m)
+                db.session.commit()
+            expanded += len(matches)
+        click.echo(f"expanded {moved} balls from {expanded} matches")
+
+    @app.cli.command("recompute-player-stats")
+    @click.option("--tournament-id", type=int, default=None, help="Only this tournament (default: all players)")
+    @click.option("--workers", type=int, default=None, help="Processes for large scopes (default: CPU count)")
+    @click.option("--check", is_flag=True, help="Report mismatches against the Delivery log without writing")
+    @click.option("--as-json", is_flag=True)
+    def recompute_player_stats_command(tournament_id, workers, check, as_json):
+        """Rebuild Player batting/bowling counters from the Delivery log.
+
+        Counters that only came from the record-result form or the legacy ball-by-ball
+        endpoint have no Delivery rows behind them and are reset; run with --check first.
+        """
+        from recompute import recompute_player_stats
+
+        mismatches = []
+        for _ in _scopes(tournament_id):
+            mismatches += recompute_player_stats(tournament_id, workers=workers, apply=not check)
+            if not check:
+                db.session.commit()
+        for mm in mismatches:
+            if as_json:
+                click.echo(json.dumps(mm))
+            else:
+                fields = ", ".join(f"{f} {mm['stored'][f]} -> {mm['expected'][f]}" for f in mm["stored"])
+                click.echo(f"player {mm['player_id']} ({mm['name']}): {fields}")
+        verb = "found" if check else "fixed"
+        click.echo(f"{len(mismatches)} player mismatches {verb}")
+        if check and mismatches:
+            raise SystemExit(1)
+
+    @app.cli.command("export-deliveries")
+    @click.option("--tournament-id", type=int, required=True)
+    @click.option("--out", type=click.Path(dir_okay=False), required=True, help="Parquet file to write")
+    @click.option("--row-group", type=int, default=None, help="Rows per Parquet row group")
+    def export_deliveries_command(tournament_id, out, row_group):
+        """Write a tournament's ball-by-ball Delivery rows to a Parquet file."""
+        from exports import write_parquet, PARQUET_ROW_GROUP
+
+        for _ in _scopes(tournament_id):
+            write_parquet(tournament_id, out, row_group=row_group or PARQUET_ROW_GROUP)
+        click.echo(f"wrote {out} ({os.path.getsize(out)} bytes)")
+
+    @app.cli.command("simulate-qualification")
+    @click.option("--tournament-id", type=int, required=True)
+    @click.option("--sims", type=int, default=1_000_000, help="Seasons to simulate")
+    @click.option("--top", type=int, default=4, help="Places that qualify")
+    @click.option("--workers", type=int, default=None, help="Processes for large runs (default: CPU count)")
+    @click.option("--as-json", is_flag=True)
+    def simulate_qualification_command(tournament_id, sims, top, workers, as_json):
+        """Monte Carlo playoff chances, for runs too big for the HTTP API."""
+        from simulate import qualification_chances
+
+        for _ in _scopes(tournament_id):
+            result = qualification_chances(tournament_id, sims=sims, top_n=top, workers=workers)
+        if as_json:
+            click.echo(json.dumps(result, indent=2))
+            return
+        click.echo(f"{result['simulations']} seasons, {result['remaining_matches']} matches left, "
+                   f"top {result['top_n']} qualify")
+        for r in result["teams"]:
+            click.echo(f"{r['team_name']:<24} {r['points']:>4} pts  qualify {r['qualify']:>7.2%}  "
+                       f"top {r['top']:>7.2%}  expected {r['expected_points']:>6.2f}")
+
+    @app.cli.command("db-upgrade")
+    def db_upgrade():
+        """Create the schema, or add missing tables, columns and indexes to an existing one."""
+        applied = create_schema()
+        router = current_app.extensions.get("shards")
+        for tid in router.tids() if router else []:
+            router.engine(tid)  # opening a writable shard brings it up to date
+            applied += [f"{change} (tournament {tid})" for change in router.upgrades.get(tid, [])]
+        for change in applied:
+            click.echo(f"added {change}")
+        click.echo(f"{len(applied)} schema changes applied")
+
+    # the app no longer creates tables on import; init-db reads better on a fresh install
+    app.cli.add_command(db_upgrade, "init-db")
+
+    @app.cli.command("archive-tournament")
+    @click.option("--tournament-id", type=int, required=True)
+    @click.option("--unarchive", is_flag=True, help="Make the tournament writable again")
+    def archive_tournament(tournament_id, unarchive):
+        """Open a sharded tournament read-only (immutable=1) from now on.
+
+        Running servers pick the change up when they restart.
+        """
+        router = current_app.extensions.get("shards")
+        if router is None or tournament_id not in router.tids():
+            raise click.ClickException(f"tournament {tournament_id} has no shard (is SHARD_DIR set?)")
+        router.set_archived(tournament_id, not unarchive)
+        click.echo(f"tournament {tournament_id} {'writable' if unarchive else 'archived (read-only)'}")
+
+    @app.cli.command("explain-report")
+    @click.option("--deliveries", type=int, default=100_000, help="Size of the generated tournament")
+    @click.option("--teams", type=int, default=30)
+    @click.option("--repeat", type=int, default=5, help="Timing samples per query (median is reported)")
+    @click.option("--db-path", default=None, help="Keep the generated SQLite file here instead of a temp file")
+    @click.option("--as-json", is_flag=True)
+    def explain_report_command(deliveries, teams, repeat, db_path, as_json):
+        """EXPLAIN QUERY PLAN + timings for every route's queries on a generated tournament."""
+        from synthetic import generate_tournament
+        from query_plans import explain_report
+
+        tmpdir = None
+        if db_path is None:
+            tmpdir = tempfile.mkdtemp(prefix="crick-explain-")
+            db_path = os.path.join(tmpdir, "explain.db")
+
+        # separate app bound to the scratch database so app.db is never touched
+        report_app = Flask("explain-report")
+        report_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.abspath(db_path)
+        db.init_app(report_app)
+        with report_app.app_context():
+            db.create_all()
+            summary = generate_tournament(teams=teams, deliveries=deliveries)
+            tid = summary["tournament_id"]
+            team_id = db.session.query(Team.id).filter_by(tournament_id=tid).order_by(Team.id).first()[0]
+            m = Match.query.filter_by(tournament_id=tid, played=True).order_by(Match.id.desc()).first()
+            rows = explain_report(tid, team_id, m.id, [m.teamA_id, m.teamB_id], repeat=repeat)
+            db.session.remove()
+
+        if as_json:
+            click.echo(json.dumps({"dataset": summary, "queries": rows}, indent=2))
+        else:
+            click.echo(f"dataset: {summary}")
+            for r in rows:
+                flag = "ok  " if r["uses_index"] else "SCAN"
+                click.echo(f"[{flag}] {r['route']:<20} {r['query']:<26} "
+                           f"{r['ms']:>9.3f} ms  (no indexes: {r.get('ms_without_indexes', 0):>9.3f} ms)")
+                for line in r["plan"]:
+                    click.echo(f"         {line}")
+        if tmpdir:
+            os.remove(db_path)
+            os.rmdir(tmpdir)
+        if not all(r["uses_index"] for r in rows):
+            raise SystemExit(1)
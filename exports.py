@@ -0,0 +1,275 @@
+# exports.py
+# Tournament exports. Rows come from joined queries read in batches (yield_per) and
+# go straight into an openpyxl write-only workbook, so memory stays flat however many
+# players a tournament has. Finished files live in an ArtifactCache keyed by
+# (tournament, format, data version): a version that was already exported is served
+# from disk, and concurrent builds never see each other's partial output
+# (temp file + atomic rename). Ball-by-ball data goes to Parquet (pyarrow, optional):
+# Delivery rows are read match by match with keyset pagination and written as
+# compressed row groups, so neither side ever holds more than one row group.
+import os
+import tempfile
+import threading
+from itertools import groupby
+
+from models import db, Tournament, Team, Player, Match, Delivery
+from standings import points_table, tournament_version
+
+EXPORT_BATCH = 1000
+PARQUET_ROW_GROUP = 64 * 1024
+
+TEAM_HEADERS = ["Name", "Players"]
+MATCH_HEADERS = ["MatchID", "TeamA", "TeamB", "A_runs", "A_overs", "A_wkts",
+                 "B_runs", "B_overs", "B_wkts", "Played", "Winner"]
+PLAYER_HEADERS = ["Name", "Team", "Runs", "Balls", "Wickets", "Economy"]
+
+
+def economy(runs_conceded, balls_bowled):
+    if (balls_bowled or 0) > 0:
+        return round((runs_conceded or 0) / (balls_bowled / 6.0), 2)
+    return 0
+
+
+def team_rows(tid):
+    # one ordered pass over team x player, grouped per team as it streams
+    q = db.session.query(Team.id, Team.name, Player.name) \
+        .outerjoin(Player, Player.team_id == Team.id) \
+        .filter(Team.tournament_id == tid).order_by(Team.id, Player.id)
+    for (_, name), rows in groupby(q.yield_per(EXPORT_BATCH), key=lambda r: (r[0], r[1])):
+        yield [name, ", ".join(r[2] for r in rows if r[2] is not None)]
+
+
+def match_rows(tid):
+    TeamA, TeamB = db.aliased(Team), db.aliased(Team)
+    q = db.session.query(
+        Match.id, TeamA.name, TeamB.name,
+        Match.a_runs, Match.a_overs, Match.a_wickets,
+        Match.b_runs, Match.b_overs, Match.b_wickets,
+        Match.played, Match.winner,
+    ).outerjoin(TeamA, TeamA.id == Match.teamA_id).outerjoin(TeamB, TeamB.id == Match.teamB_id) \
+     .filter(Match.tournament_id == tid).order_by(Match.id)
+    for row in q.yield_per(EXPORT_BATCH):
+        row = list(row)
+        row[1], row[2] = row[1] or "", row[2] or ""
+        yield row
+
+
+def player_rows(tid):
+    q = db.session.query(
+        Player.name, Team.name, Player.runs, Player.balls_faced, Player.wickets,
+        Player.runs_conceded, Player.balls_bowled,
+    ).join(Team, Team.id == Player.team_id).filter(Team.tournament_id == tid).order_by(Player.id)
+    for name, team, runs, balls, wickets, rc, bb in q.yield_per(EXPORT_BATCH):
+        yield [name, team or "", runs or 0, balls or 0, wickets or 0, economy(rc, bb)]
+
+
+def write_excel(tid, path):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    for title, headers, rows in (
+        ("Teams", TEAM_HEADERS, team_rows(tid)),
+        ("Matches", MATCH_HEADERS, match_rows(tid)),
+        ("Players", PLAYER_HEADERS, player_rows(tid)),
+    ):
+        ws = wb.create_sheet(title)
+        ws.append(headers)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def write_pdf(tid, path):
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    tour = db.session.get(Tournament, tid)
+    doc = SimpleDocTemplate(path, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+
+    story.append(Paragraph(f"Tournament: {tour.name}", styles['Title']))
+    story.append(Spacer(1, 12))
+
+    # Points table
+    table_data = [["Team","P","W","L","T","Pts","RF","RA","NRR"]]
+    for r in points_table(tid):
+        table_data.append([r['team_name'], r['played'], r['won'], r['lost'], r['tied'], r['points'], r['runs_for'], r['runs_against'], r['nrr']])
+    t = Table(table_data)
+    t.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.5,colors.grey), ('BACKGROUND',(0,0),(-1,0),colors.lightgrey)]))
+    story.append(t)
+    story.append(Spacer(1, 12))
+
+    # Top players
+    story.append(Paragraph("Top Players", styles['Heading2']))
+    pdata = [["Player","Team","Runs","Wickets"]]
+    top = db.session.query(Player.name, Team.name, Player.runs, Player.wickets) \
+        .join(Team, Team.id == Player.team_id).filter(Team.tournament_id == tid) \
+        .order_by(Player.id).limit(20)
+    for name, team, runs, wickets in top:
+        pdata.append([name, team or '', runs or 0, wickets or 0])
+    tp = Table(pdata)
+    tp.setStyle(TableStyle([('GRID',(0,0),(-1,-1),0.3,colors.grey),('BACKGROUND',(0,0),(-1,0),colors.lightgrey)]))
+    story.append(tp)
+
+    doc.build(story)
+
+
+# Delivery columns as read (keyset order), then the names looked up for the id columns
+DELIVERY_FIELDS = ["match_id", "created_at", "delivery_id", "over", "ball_in_over", "batting_team_id",
+                   "bowling_team_id", "striker_id", "non_striker_id", "bowler_id", "runs", "extras", "wicket",
+                   "wicket_type", "client_seq"]
+DELIVERY_NAMES = [("batting_team", "batting_team_id", "teams"), ("bowling_team", "bowling_team_id", "teams"),
+                  ("striker", "striker_id", "players"), ("non_striker", "non_striker_id", "players"),
+                  ("bowler", "bowler_id", "players")]
+
+
+def delivery_pages(tid, page=10 * EXPORT_BATCH):
+    # keyset pagination in (match_id, created_at, id) order, which ix_delivery_match_created
+    # serves directly; restarting the match list at the last match keeps every page a
+    # seek rather than an OFFSET scan, so late pages cost the same as early ones
+    cols = (Delivery.match_id, Delivery.created_at, Delivery.id, Delivery.over, Delivery.ball_in_over,
+            Delivery.batting_team_id, Delivery.bowling_team_id, Delivery.striker_id,
+            Delivery.non_striker_id, Delivery.bowler_id, Delivery.runs, Delivery.extras,
+            Delivery.wicket, Delivery.wicket_type, Delivery.client_seq)
+    after = None
+    while True:
+        matches = db.select(Match.id).where(Match.tournament_id == tid)
+        q = db.select(*cols)
+        if after is not None:
+            matches = matches.where(Match.id >= after[0])
+            q = q.where(db.tuple_(Delivery.match_id, Delivery.created_at, Delivery.id) > db.tuple_(*after))
+        q = q.where(Delivery.match_id.in_(matches)) \
+            .order_by(Delivery.match_id, Delivery.created_at, Delivery.id).limit(page)
+        rows = db.session.execute(q).all()
+        if rows:
+            yield rows
+        if len(rows) < page:
+            return
+        after = tuple(rows[-1][:3])
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    names = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("delivery_id", pa.int64()), ("match_id", pa.int32()),
+        ("over", pa.int16()), ("ball_in_over", pa.int16()),
+        ("batting_team_id", pa.int32()), ("bowling_team_id", pa.int32()),
+        ("striker_id", pa.int32()), ("non_striker_id", pa.int32()), ("bowler_id", pa.int32()),
+        ("runs", pa.int16()),
+        # a handful of distinct values each: dictionary-encoded in memory and on disk
+        ("extras", names), ("wicket", pa.bool_()), ("wicket_type", names),
+        ("client_seq", pa.int64()), ("created_at", pa.timestamp("ms")),
+        ("batting_team", names), ("bowling_team", names),
+        ("striker", names), ("non_striker", names), ("bowler", names),
+    ])
+
+
+def write_parquet(tid, path, row_group=PARQUET_ROW_GROUP):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    lookups = {
+        "teams": dict(db.session.query(Team.id, Team.name).filter(Team.tournament_id == tid)),
+        "players": dict(db.session.query(Player.id, Player.name).filter(Player.tournament_id == tid)),
+    }
+
+    def write(writer, buf):
+        for name, id_field, table in DELIVERY_NAMES:
+            buf[name] = [lookups[table].get(i) for i in buf[id_field]]
+        writer.write_table(pa.Table.from_pydict(buf, schema=schema), row_group_size=row_group)
+
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        buf = {name: [] for name in DELIVERY_FIELDS}
+        for rows in delivery_pages(tid):
+            for name, values in zip(DELIVERY_FIELDS, zip(*rows)):
+                buf[name].extend(values)
+            if len(buf["delivery_id"]) >= row_group:
+                write(writer, buf)
+                buf = {name: [] for name in DELIVERY_FIELDS}
+        if buf["delivery_id"]:
+            write(writer, buf)
+
+
+EXPORT_WRITERS = {
+    "xlsx": write_excel,
+    "pdf": write_pdf,
+    "parquet": write_parquet,
+}
+EXPORT_FORMATS = {"xlsx": "xlsx", "excel": "xlsx", "pdf": "pdf", "parquet": "parquet"}
+MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ArtifactCache:
+    # finished export files on disk, evicted least-recently-used once over max_bytes
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, tid, fmt, version):
+        return os.path.join(self.directory, f"tournament_{tid}_v{version}.{fmt}")
+
+    def get(self, tid, fmt, version):
+        path = self.path_for(tid, fmt, version)
+        try:
+            os.utime(path)  # mtime doubles as last-used time for eviction
+        except FileNotFoundError:
+            return None
+        return path
+
+    def build(self, tid, fmt, version):
+        # caller holds an app context; returns the cached path
+        path = self.get(tid, fmt, version)
+        if path:
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".tournament_{tid}_", suffix=f".{fmt}", dir=self.directory)
+        os.close(fd)
+        try:
+            EXPORT_WRITERS[fmt](tid, tmp)
+            path = self.path_for(tid, fmt, version)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.startswith("tournament_"):
+                    continue
+                p = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if p == keep:
+                    continue
+                try:
+                    os.remove(p)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+
+
+def export_file(cache, tid, fmt):
+    # -> path of the export for the tournament's current version, building it if needed
+    return cache.build(tid, fmt, tournament_version(tid) or 0)
@@ -0,0 +1,109 @@
+# fragments.py
+# Rendered-fragment cache for templates. Wrap a block whose output depends only on
+# some data version:
+#
+#     {% cache "points_table", tour.id, tour.version %} ... {% endcache %}
+#
+# The rendered HTML is kept in a byte-bounded LRU keyed by the template name plus
+# those values, so every viewer of an unchanged tournament gets the stored string
+# instead of a re-render. A write bumps the version, which changes the key; stale
+# entries are never read again and age out of the LRU.
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (html, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, html):
+        size = len(html.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (html, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_render(self, key, render):
+        html = self.get(key)
+        if html is None:
+            html = render()
+            self.set(key, html)
+        return html
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def metric_lines(self):
+        with self.lock:
+            return [
+                "# TYPE crick_fragment_cache_hits_total counter",
+                f"crick_fragment_cache_hits_total {self.hits}",
+                "# TYPE crick_fragment_cache_misses_total counter",
+                f"crick_fragment_cache_misses_total {self.misses}",
+                "# TYPE crick_fragment_cache_evictions_total counter",
+                f"crick_fragment_cache_evictions_total {self.evictions}",
+                "# TYPE crick_fragment_cache_bytes gauge",
+                f"crick_fragment_cache_bytes {self.bytes}",
+                "# TYPE crick_fragment_cache_entries gauge",
+                f"crick_fragment_cache_entries {len(self.entries)}",
+            ]
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_cached", [nodes.Tuple(args, "load")]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.get_or_render(key, caller)
+
+
+def init_fragment_cache(app, max_bytes):
+    # max_bytes=0 keeps the {% cache %} tag working but renders every time
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    cache = FragmentCache(max_bytes) if max_bytes else None
+    app.jinja_env.fragment_cache = cache
+    return cache
@@ -0,0 +1,79 @@
+# httpcache.py
+# Conditional GETs for read-heavy routes. Every write route bumps Tournament.version
+# (and Match.version for writes to one match), so "<route>/<key>/v<version>" is a
+# strong validator for anything rendered from that data. The version is read with a
+# single scalar query; a matching If-None-Match gets a 304 before the view (and the
+# ORM) runs. Cache-Control is "public, no-cache" by default so a local reverse proxy
+# may store the response but revalidates every hit, which is one indexed lookup here.
+import os
+import zlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session
+
+from models import db, Tournament, Team, Match
+
+
+def team_version(team_id):
+    # team pages show tournament-wide data (matches, players), so they follow its version
+    return db.session.execute(
+        db.select(Tournament.version).join(Team, Team.tournament_id == Tournament.id)
+        .where(Team.id == team_id)).scalar()
+
+
+def match_version(match_id):
+    return db.session.execute(db.select(Match.version).where(Match.id == match_id)).scalar()
+
+
+def deploy_token(root):
+    # changes whenever the code or templates change, so old ETags die with a deploy
+    newest = 0
+    for folder in (root, os.path.join(root, "templates")):
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if name.endswith((".py", ".html")):
+                newest = max(newest, int(os.path.getmtime(os.path.join(folder, name))))
+    return format(zlib.crc32(str(newest).encode()), "x")
+
+
+def query_tag(args):
+    # args: (name, value) pairs; the same URL with other query args (metric, cursor,
+    # sims, overs...) is another body, so it needs another validator
+    if not args:
+        return ""
+    return "-q" + format(zlib.crc32(urlencode(sorted(args)).encode()), "x")
+
+
+def _cache_control():
+    max_age = current_app.config.get("HTTP_CACHE_MAX_AGE", 0)
+    return f"public, max-age={max_age}" if max_age else "public, no-cache"
+
+
+def versioned(lookup):
+    # decorator for views taking a single id argument; lookup(id) -> version or None
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # a pending flash message makes the page user-specific; render it normally
+            if current_app.config["SESSION_COOKIE_NAME"] in request.cookies and session.get("_flashes"):
+                return view(**kwargs)
+            (key,) = kwargs.values()
+            version = lookup(key)
+            if version is None:
+                return view(**kwargs)  # let the view 404
+            # read before the view runs: the body is never older than its tag
+            etag = f"{request.endpoint}-{key}-v{version}{query_tag(list(request.args.items(multi=True)))}" \
+                f"-{current_app.config['ETAG_SALT']}"
+            if request.if_none_match.contains(etag):
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(view(**kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = _cache_control()
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,142 @@
+# instrument.py
+# Per-request instrumentation: SQL statement count and time (SQLAlchemy cursor events)
+# plus latency, recorded per endpoint in fixed-bucket histograms and exposed in
+# Prometheus text format at /metrics. Requests that run more statements than
+# QUERY_BUDGET are logged. With QUERY_COUNT_DEBUG (or app.debug) on, every response
+# also carries an X-Query-Count header so N+1 regressions show up immediately.
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_listening = False
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get("query_count", 0) + 1
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        starts = conn.info.get("query_start")
+        if starts:
+            g.query_time = g.get("query_time", 0.0) + (time.perf_counter() - starts.pop())
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _labels(**kw):
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in kw.items()) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}  # (endpoint, method, status) -> count
+        self.latency = {}  # endpoint -> Histogram (seconds)
+        self.queries = {}  # endpoint -> Histogram (statements per request)
+        self.query_seconds = {}  # endpoint -> total seconds spent in SQL
+        self.over_budget = {}  # endpoint -> count
+        self.collectors = []  # callables returning extra exposition lines
+
+    def observe(self, endpoint, method, status, seconds, query_count, query_seconds, over_budget):
+        with self.lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(endpoint, Histogram(QUERY_COUNT_BUCKETS)).observe(query_count)
+            self.query_seconds[endpoint] = self.query_seconds.get(endpoint, 0.0) + query_seconds
+            if over_budget:
+                self.over_budget[endpoint] = self.over_budget.get(endpoint, 0) + 1
+
+    def _histogram_lines(self, name, hists):
+        lines = [f"# TYPE {name} histogram"]
+        for endpoint, h in sorted(hists.items()):
+            cumulative = 0
+            for le, c in zip(h.buckets, h.counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_labels(endpoint=endpoint, le=le)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(endpoint=endpoint, le='+Inf')} {h.count}")
+            lines.append(f"{name}_sum{_labels(endpoint=endpoint)} {h.total}")
+            lines.append(f"{name}_count{_labels(endpoint=endpoint)} {h.count}")
+        return lines
+
+    def render(self):
+        with self.lock:
+            lines = ["# TYPE crick_http_requests_total counter"]
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f"crick_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}")
+            lines += self._histogram_lines("crick_http_request_duration_seconds", self.latency)
+            lines += self._histogram_lines("crick_db_queries_per_request", self.queries)
+            lines.append("# TYPE crick_db_query_duration_seconds_total counter")
+            for endpoint, secs in sorted(self.query_seconds.items()):
+                lines.append(f"crick_db_query_duration_seconds_total{_labels(endpoint=endpoint)} {secs}")
+            lines.append("# TYPE crick_db_query_budget_exceeded_total counter")
+            for endpoint, n in sorted(self.over_budget.items()):
+                lines.append(f"crick_db_query_budget_exceeded_total{_labels(endpoint=endpoint)} {n}")
+        for collect in self.collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+def init_instrumentation(app):
+    # one Metrics per app, so apps built by create_app() in one process stay separate
+    global _listening
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor)
+        event.listen(Engine, "after_cursor_execute", _after_cursor)
+        _listening = True
+
+    @app.before_request
+    def _start_request():
+        g.query_count = 0
+        g.query_time = 0.0
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_request(response):
+        count = g.get("query_count", 0)
+        if app.debug or app.config.get("QUERY_COUNT_DEBUG"):
+            response.headers["X-Query-Count"] = str(count)
+        if app.config.get("METRICS_ENABLED", True) and request.endpoint != "metrics_endpoint":
+            endpoint = request.endpoint or "unmatched"
+            budget = app.config.get("QUERY_BUDGET", 50)
+            over = bool(budget) and count > budget
+            if over:
+                app.logger.warning("%s %s ran %d SQL statements (budget %d)",
+                                   request.method, request.path, count, budget)
+            metrics.observe(endpoint, request.method, response.status_code,
+                            time.perf_counter() - g.get("request_start", time.perf_counter()),
+                            count, g.get("query_time", 0.0), over)
+        return response
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    return metrics
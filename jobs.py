@@ -0,0 +1,77 @@
+# jobs.py
+# Background export jobs. Building a PDF/workbook for a big tournament takes seconds,
+# so POST /tournament/<tid>/export/<fmt> queues it on a small thread pool and returns
+# a job id; the client polls the status endpoint and downloads the cached artifact.
+# Identical requests (same tournament, format and data version) share one job.
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import bind_shard
+from standings import tournament_version
+
+JOB_TTL_SECONDS = 3600
+
+
+class ExportJobs:
+    def __init__(self, app, cache, workers=2):
+        self.app = app
+        self.cache = cache
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.jobs = {}  # job_id -> dict
+        self.by_key = {}  # (tid, fmt, version) -> job_id of a queued/running job
+        self._executor = None
+
+    def _pool(self):
+        # created on first use so importing the app starts no threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export")
+        return self._executor
+
+    def submit(self, tid, fmt):
+        # caller holds an app context (needed for the version lookup)
+        version = tournament_version(tid) or 0
+        key = (tid, fmt, version)
+        with self.lock:
+            self._prune()
+            job_id = self.by_key.get(key)
+            if job_id:
+                return self.jobs[job_id]
+            job = {
+                "id": uuid.uuid4().hex, "tournament_id": tid, "format": fmt, "version": version,
+                "status": "queued", "error": None, "path": None, "created": time.time(), "finished": None,
+            }
+            self.jobs[job["id"]] = job
+
+            cached = self.cache.get(tid, fmt, version)
+            if cached:
+                job.update(status="done", path=cached, finished=time.time())
+                return job
+            self.by_key[key] = job["id"]
+        self._pool().submit(bind_shard(self._run), job)
+        return job
+
+    def _run(self, job):
+        job["status"] = "running"
+        try:
+            with self.app.app_context():
+                job["path"] = self.cache.build(job["tournament_id"], job["format"], job["version"])
+            job["status"] = "done"
+        except Exception as e:
+            self.app.logger.exception("export job %s failed", job["id"])
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished"] = time.time()
+            with self.lock:
+                self.by_key.pop((job["tournament_id"], job["format"], job["version"]), None)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j for j, job in self.jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self.jobs[job_id]
@@ -0,0 +1,86 @@
+# leaders.py
+# Tournament leaderboards. Every metric is a (generated) Player column with a
+# (tournament_id, metric) index, so a page is read straight off the index in metric
+# order. Pages are keyset-paginated: the cursor carries the last (value, id) seen,
+# so page 50 costs the same as page 1. Rate metrics only rank players who pass a
+# qualification threshold (balls faced / bowled), overridable per request.
+from collections import namedtuple
+
+from models import db, Team, Player
+
+Metric = namedtuple("Metric", "column descending qualifier default_min")
+
+LEADER_METRICS = {
+    "runs": Metric(Player.runs, True, None, 0),
+    "strike_rate": Metric(Player.strike_rate, True, Player.balls_faced, 30),
+    "average": Metric(Player.batting_average, True, Player.balls_faced, 30),
+    "wickets": Metric(Player.wickets, True, None, 0),
+    "economy": Metric(Player.economy, False, Player.balls_bowled, 60),
+    "bowling_strike_rate": Metric(Player.bowling_strike_rate, False, Player.balls_bowled, 60),
+}
+
+MAX_PAGE = 100
+
+
+class LeaderboardError(ValueError):
+    pass
+
+
+def _parse_cursor(cursor):
+    # "<rank>:<value>:<player id>" as produced by leaders()
+    try:
+        rank, value, pid = cursor.split(":")
+        return int(rank), float(value), int(pid)
+    except (AttributeError, ValueError):
+        raise LeaderboardError("invalid cursor")
+
+
+def leaders(tid, metric, limit=20, cursor=None, min_qualifier=None):
+    # -> (players, next_cursor, rank of the first player, threshold used)
+    spec = LEADER_METRICS.get(metric)
+    if spec is None:
+        raise LeaderboardError(f"unknown metric {metric!r}, expected one of {', '.join(LEADER_METRICS)}")
+    limit = max(1, min(int(limit), MAX_PAGE))
+    threshold = spec.default_min if min_qualifier is None else max(0, int(min_qualifier))
+
+    col = spec.column
+    q = Player.query.filter(Player.tournament_id == tid, col.isnot(None))
+    if spec.qualifier is not None and threshold:
+        q = q.filter(spec.qualifier >= threshold)
+    if spec.descending:
+        q = q.order_by(col.desc(), Player.id.desc())
+    else:
+        q = q.order_by(col.asc(), Player.id.asc())
+
+    rank = 1
+    if cursor:
+        rank, value, pid = _parse_cursor(cursor)
+        if spec.descending:
+            q = q.filter(db.or_(col < value, db.and_(col == value, Player.id < pid)))
+        else:
+            q = q.filter(db.or_(col > value, db.and_(col == value, Player.id > pid)))
+
+    rows = q.limit(limit + 1).all()
+    page, more = rows[:limit], len(rows) > limit
+    next_cursor = None
+    if more:
+        last = page[-1]
+        next_cursor = f"{rank + len(page)}:{getattr(last, col.key)!r}:{last.id}"
+    return page, next_cursor, rank, threshold
+
+
+def player_card(p):
+    def r(v):
+        return round(v, 2) if v is not None else None
+    return {
+        "player_id": p.id, "name": p.name, "team_id": p.team_id,
+        "runs": p.runs or 0, "balls_faced": p.balls_faced or 0, "dismissals": p.dismissals or 0,
+        "strike_rate": r(p.strike_rate), "average": r(p.batting_average),
+        "wickets": p.wickets or 0, "balls_bowled": p.balls_bowled or 0,
+        "runs_conceded": p.runs_conceded or 0,
+        "economy": r(p.economy), "bowling_strike_rate": r(p.bowling_strike_rate),
+    }
+
+
+def team_names(team_ids):
+    return dict(db.session.query(Team.id, Team.name).filter(Team.id.in_(set(team_ids))).all()) if team_ids else {}
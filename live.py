@@ -0,0 +1,156 @@
+# live.py
+# In-process fan-out for live scoring. One MatchHub per match holds the latest
+# score and a short backlog of pre-serialized SSE messages; post_delivery
+# publishes into it after commit and every /stream viewer just reads from a
+# queue, so the DB is touched once per ball (and once when a hub is created),
+# never once per viewer.
+import json
+import queue
+import threading
+from collections import deque
+
+BACKLOG_SIZE = 256
+SUBSCRIBER_QUEUE_SIZE = 512
+
+
+def sse_message(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":"), default=str))
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+    def push(self, msg):
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            # slow client: cut it loose, it will reconnect with Last-Event-ID
+            self.dropped = True
+
+
+class MatchHub:
+    def __init__(self, match_id, score, last_event_id):
+        self.match_id = match_id
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.backlog = deque()  # (event_id, message)
+        self.score = score  # {batting_team_id(str): innings dict}
+        self.last_event_id = last_event_id
+        # ids <= replay_floor can no longer be replayed from the backlog
+        self.replay_floor = last_event_id or 0
+
+    def publish(self, event_id, event, data, innings=None):
+        msg = sse_message(event, data, event_id)
+        with self.lock:
+            if self.last_event_id is not None and event_id <= self.last_event_id:
+                # a concurrent writer published a later ball first: slot this one into
+                # the backlog in id order, but leave the newer score and id alone
+                if not self._insert_late(event_id, msg):
+                    return
+            else:
+                if innings is not None:
+                    self.score[str(innings.get("batting_team_id"))] = innings
+                self.backlog.append((event_id, msg))
+                self.last_event_id = event_id
+            if len(self.backlog) > BACKLOG_SIZE:
+                self.replay_floor = self.backlog.popleft()[0]
+            subs = list(self.subscribers)
+        for sub in subs:
+            sub.push(msg)
+
+    def _insert_late(self, event_id, msg):
+        # caller holds the lock; False if the event was already published
+        if event_id <= self.replay_floor:
+            return True  # too old to replay, only live viewers get it
+        i = len(self.backlog)
+        while i and self.backlog[i - 1][0] >= event_id:
+            if self.backlog[i - 1][0] == event_id:
+                return False
+            i -= 1
+        self.backlog.insert(i, (event_id, msg))
+        return True
+
+    def reset(self, score):
+        # a corrected ball rewrites history: send everyone the full score and stop
+        # replaying the old backlog, so reconnecting clients get a fresh snapshot
+        with self.lock:
+            self.score = score
+            self.backlog.clear()
+            self.replay_floor = (self.last_event_id or 0) + 1
+            msg = sse_message("score", {"match_id": self.match_id, "score": dict(score), "corrected": True},
+                              self.last_event_id)
+            subs = list(self.subscribers)
+        for sub in subs:
+            sub.push(msg)
+
+    def subscribe(self, last_event_id=None):
+        # returns (subscriber, messages to send first)
+        sub = Subscriber()
+        with self.lock:
+            if last_event_id is not None and last_event_id >= self.replay_floor:
+                first = [msg for eid, msg in self.backlog if eid > last_event_id]
+            else:
+                first = [sse_message("score", {"match_id": self.match_id, "score": dict(self.score)},
+                                     self.last_event_id)]
+            self.subscribers.add(sub)
+        return sub, first
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def viewer_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+
+_hubs = {}
+_hubs_lock = threading.Lock()
+
+
+def get_hub(match_id, loader=None):
+    # loader() -> (score, last_event_id); only called when the hub is first created
+    hub = _hubs.get(match_id)
+    if hub is not None or loader is None:
+        return hub
+    with _hubs_lock:
+        hub = _hubs.get(match_id)
+        if hub is None:
+            score, last_id = loader()
+            hub = _hubs[match_id] = MatchHub(match_id, score, last_id)
+    return hub
+
+
+def publish_delivery(match_id, delivery, innings):
+    # no hub means nobody has opened the stream yet; nothing to do
+    hub = get_hub(match_id)
+    if hub is not None:
+        hub.publish(delivery["id"], "delivery", {"delivery": delivery, "innings": innings}, innings=innings)
+
+
+def publish_correction(match_id, loader):
+    # loader() -> current score; only read when someone is watching
+    hub = get_hub(match_id)
+    if hub is not None:
+        hub.reset(loader())
+
+
+def stream_messages(hub, sub, first, heartbeat=15.0):
+    try:
+        yield "retry: 3000\n\n"
+        for msg in first:
+            yield msg
+        while not sub.dropped:
+            try:
+                yield sub.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": ping\n\n"
+    finally:
+        hub.unsubscribe(sub)
@@ -1,9 +1,37 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from contextvars import ContextVar
 from datetime import datetime
 import json
 
-db = SQLAlchemy()
+# engine of the tournament shard the current request / job works on (see shards.py);
+# None means the main database
+shard_engine = ContextVar("shard_engine", default=None)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = shard_engine.get()
+        if bind is None and engine is not None:
+            return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def bind_shard(fn):
+    # wrap fn so it runs against the caller's shard from another thread
+    engine = shard_engine.get()
+
+    def call(*args, **kwargs):
+        token = shard_engine.set(engine)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            shard_engine.reset(token)
+    return call
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # ─────────────────────────────────────────
 # Tournament
@@ -16,6 +44,17 @@ class Tournament(db.Model):
     matches = db.relationship("Match", backref="tournament", cascade="all,delete-orphan")
     settings = db.Column(db.Text, default="{}")
 
+    # bumped by every write that touches the tournament's data; the standings
+    # cache is valid while standings_version == version
+    version = db.Column(db.Integer, default=0, nullable=False)
+    standings_version = db.Column(db.Integer, default=-1, nullable=False)
+    # catalog flag in sharded storage: the shard is opened read-only (immutable=1)
+    archived = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_tournament_created_at", "created_at"),
+    )
+
     def settings_dict(self):
         try:
             return json.loads(self.settings or "{}")
@@ -30,29 +69,74 @@ class Team(db.Model):
     name = db.Column(db.String(140), nullable=False)
     tournament_id = db.Column(db.Integer, db.ForeignKey("tournament.id"), nullable=False)
     players = db.relationship("Player", backref="team", cascade="all,delete-orphan")
+    standing = db.relationship("Standing", cascade="all,delete-orphan")
     logo = db.Column(db.String(300), nullable=True)
     playing_xi = db.Column(db.Text, default="[]")  # json list
+    roster_version = db.Column(db.Integer, default=0, nullable=False)  # bumped when its players change
+
+    __table_args__ = (
+        db.Index("ix_team_tournament", "tournament_id"),
+    )
 
 # ─────────────────────────────────────────
 # Player
 # ─────────────────────────────────────────
+# Leaderboard metrics are virtual generated columns: SQLite derives them from the
+# counters on every write, whichever route did the write, and the per-tournament
+# indexes below keep them sorted so a leaderboard page is an index range read.
+PLAYER_METRIC_SQL = {
+    "strike_rate": "CASE WHEN balls_faced > 0 THEN runs * 100.0 / balls_faced END",
+    "batting_average": "CASE WHEN dismissals > 0 THEN runs * 1.0 / dismissals END",
+    "economy": "CASE WHEN balls_bowled > 0 THEN runs_conceded * 6.0 / balls_bowled END",
+    "bowling_strike_rate": "CASE WHEN wickets > 0 THEN balls_bowled * 1.0 / wickets END",
+}
+
+
+def _team_tournament(context):
+    # Player.tournament_id is a copy of its team's, filled in on insert
+    team_id = context.get_current_parameters().get("team_id")
+    return context.connection.execute(
+        db.select(Team.tournament_id).where(Team.id == team_id)).scalar()
+
+
 class Player(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(140), nullable=False)
     team_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=False)
+    tournament_id = db.Column(db.Integer, default=_team_tournament)
 
     # Batting
     runs = db.Column(db.Integer, default=0)
     balls_faced = db.Column(db.Integer, default=0)
+    dismissals = db.Column(db.Integer, default=0)
 
     # Bowling
     wickets = db.Column(db.Integer, default=0)
     balls_bowled = db.Column(db.Integer, default=0)
     runs_conceded = db.Column(db.Integer, default=0)
 
+    # Derived (read-only)
+    strike_rate = db.Column(db.Float, db.Computed(PLAYER_METRIC_SQL["strike_rate"], persisted=False))
+    batting_average = db.Column(db.Float, db.Computed(PLAYER_METRIC_SQL["batting_average"], persisted=False))
+    economy = db.Column(db.Float, db.Computed(PLAYER_METRIC_SQL["economy"], persisted=False))
+    bowling_strike_rate = db.Column(db.Float, db.Computed(PLAYER_METRIC_SQL["bowling_strike_rate"], persisted=False))
+
     is_keeper = db.Column(db.Boolean, default=False)
     is_captain = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        # roster lookups and per-team leaderboards
+        db.Index("ix_player_team_runs", "team_id", "runs"),
+        db.Index("ix_player_team_wickets", "team_id", "wickets"),
+        # tournament leaderboards (leaders.py)
+        db.Index("ix_player_tournament_runs", "tournament_id", "runs"),
+        db.Index("ix_player_tournament_wickets", "tournament_id", "wickets"),
+        db.Index("ix_player_tournament_strike_rate", "tournament_id", "strike_rate"),
+        db.Index("ix_player_tournament_batting_average", "tournament_id", "batting_average"),
+        db.Index("ix_player_tournament_economy", "tournament_id", "economy"),
+        db.Index("ix_player_tournament_bowling_strike_rate", "tournament_id", "bowling_strike_rate"),
+    )
+
 # ─────────────────────────────────────────
 # Match
 # ─────────────────────────────────────────
@@ -63,6 +147,7 @@ class Match(db.Model):
     teamB_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=False)
 
     scheduled = db.Column(db.String(140), nullable=True)
+    venue = db.Column(db.String(140), nullable=True)
     played = db.Column(db.Boolean, default=False)
     toss_winner_id = db.Column(db.Integer, nullable=True)
     toss_choice = db.Column(db.String(20), nullable=True)
@@ -77,8 +162,20 @@ class Match(db.Model):
 
     winner = db.Column(db.String(20), nullable=True)
     ball_by_ball = db.Column(db.Text, default="[]")
+    # bumped by writes to this match's scoring data (ETag for the score API)
+    version = db.Column(db.Integer, default=0, nullable=False)
 
     deliveries = db.relationship("Delivery", backref="match", lazy=True, cascade="all, delete-orphan")
+    ball_events = db.relationship("BallEvent", lazy=True, cascade="all, delete-orphan")
+    innings = db.relationship("InningsAggregate", lazy=True, cascade="all, delete-orphan")
+    checkpoints = db.relationship("InningsCheckpoint", lazy=True, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index("ix_match_tournament", "tournament_id"),
+        # team_stats filters teamA_id = ? OR teamB_id = ? (one index per side)
+        db.Index("ix_match_team_a", "teamA_id"),
+        db.Index("ix_match_team_b", "teamB_id"),
+    )
 
 # ─────────────────────────────────────────
 # Delivery (BALL-BY-BALL)
@@ -102,31 +199,212 @@ class Delivery(db.Model):
     wicket = db.Column(db.Boolean, default=False)
     wicket_type = db.Column(db.String(50), default="")
 
+    # scorer-side sequence number, makes retried uploads idempotent
+    client_seq = db.Column(db.Integer, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # recent balls / replay for a match, in scoring order
+        db.Index("ix_delivery_match_created", "match_id", "created_at"),
+        db.Index("ux_delivery_match_client_seq", "match_id", "client_seq", unique=True),
+    )
+
+# ─────────────────────────────────────────
+# BallEvent (append-only store behind the legacy /b2b/add JSON API)
+# ─────────────────────────────────────────
+class BallEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey("match.id"), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1-based position in the old ball_by_ball list
+    payload = db.Column(db.Text, default="{}")  # the client payload, verbatim
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ux_ball_event_match_seq", "match_id", "seq", unique=True),
+    )
 
 # ─────────────────────────────────────────
-# Utility functions for leaderboard
+# Innings aggregate (running totals per batting side, kept in step with Delivery)
 # ─────────────────────────────────────────
-def top_batsmen_for_team(team_id):
-    result = db.session.query(
-        Player.name,
-        db.func.sum(Delivery.runs).label("total_runs")
-    ).join(Delivery, Player.id == Delivery.striker_id) \
-     .filter(Player.team_id == team_id) \
-     .group_by(Player.id) \
-     .order_by(db.desc("total_runs")) \
-     .limit(5).all()
-    return result
+class InningsAggregate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey("match.id"), nullable=False)
+    batting_team_id = db.Column(db.Integer, db.ForeignKey("team.id"))
+    bowling_team_id = db.Column(db.Integer, db.ForeignKey("team.id"))
+
+    runs = db.Column(db.Integer, default=0)
+    wickets = db.Column(db.Integer, default=0)
+    legal_balls = db.Column(db.Integer, default=0)
+    deliveries = db.Column(db.Integer, default=0)
+    extras = db.Column(db.Text, default="{}")  # json {"WD": runs, "NB": runs, ...}
+
+    striker_id = db.Column(db.Integer, nullable=True)
+    non_striker_id = db.Column(db.Integer, nullable=True)
+    bowler_id = db.Column(db.Integer, nullable=True)
+
+    current_over = db.Column(db.Integer, nullable=True)
+    current_over_balls = db.Column(db.Text, default="[]")  # json list of ball symbols
+    last_over = db.Column(db.Text, default="{}")  # json summary of the previous over
+
+    last_delivery_id = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint("match_id", "batting_team_id"),)
+
+    def extras_dict(self):
+        try:
+            return json.loads(self.extras or "{}")
+        except:
+            return {}
+
+    def to_dict(self):
+        balls = self.legal_balls or 0
+        try:
+            this_over = json.loads(self.current_over_balls or "[]")
+            last_over = json.loads(self.last_over or "{}")
+        except:
+            this_over, last_over = [], {}
+        return {
+            "batting_team_id": self.batting_team_id,
+            "bowling_team_id": self.bowling_team_id,
+            "runs": self.runs or 0,
+            "wickets": self.wickets or 0,
+            "balls": balls,
+            "deliveries": self.deliveries or 0,
+            "overs": f"{balls // 6}.{balls % 6}",
+            "extras": self.extras_dict(),
+            "striker_id": self.striker_id,
+            "non_striker_id": self.non_striker_id,
+            "bowler_id": self.bowler_id,
+            "this_over": this_over,
+            "last_over": last_over,
+        }
+
+
+# ─────────────────────────────────────────
+# Innings checkpoint (aggregate state at each over boundary, for corrections)
+# ─────────────────────────────────────────
+class InningsCheckpoint(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey("match.id"), nullable=False)
+    batting_team_id = db.Column(db.Integer, db.ForeignKey("team.id"))
+    seq = db.Column(db.Integer, nullable=False)  # deliveries of the innings folded into state
+    over = db.Column(db.Integer, nullable=True)  # the over that starts after them
+    state = db.Column(db.Text, default="{}")  # json of the InningsAggregate columns
+
+    __table_args__ = (
+        db.Index("ix_innings_checkpoint_match_team_seq", "match_id", "batting_team_id", "seq"),
+    )
+
+
+# ─────────────────────────────────────────
+# Standing (cached points-table row, see standings.py)
+# ─────────────────────────────────────────
+class Standing(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tournament_id = db.Column(db.Integer, db.ForeignKey("tournament.id"), nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey("team.id"), nullable=False)
+
+    played = db.Column(db.Integer, default=0)
+    won = db.Column(db.Integer, default=0)
+    lost = db.Column(db.Integer, default=0)
+    tied = db.Column(db.Integer, default=0)
+    points = db.Column(db.Integer, default=0)
+
+    # NRR numerators / denominators
+    runs_for = db.Column(db.Integer, default=0)
+    balls_faced = db.Column(db.Integer, default=0)
+    runs_against = db.Column(db.Integer, default=0)
+    balls_bowled = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.UniqueConstraint("tournament_id", "team_id"),)
+
+# ─────────────────────────────────────────
+# Schema upgrades for existing app.db files (create_all never alters tables)
+# ─────────────────────────────────────────
+ADDED_COLUMNS = [
+    # (table, column, DDL type)
+    ("delivery", "client_seq", "INTEGER"),
+    ("tournament", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("tournament", "standings_version", "INTEGER NOT NULL DEFAULT -1"),
+    ("tournament", "archived", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("match", "venue", "VARCHAR(140)"),
+    ("match", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("team", "roster_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("player", "tournament_id", "INTEGER"),
+    ("player", "dismissals", "INTEGER DEFAULT 0"),
+] + [
+    ("player", name, f"FLOAT GENERATED ALWAYS AS ({expr}) VIRTUAL")
+    for name, expr in PLAYER_METRIC_SQL.items()
+]
+
+# run once, right after the column is added
+COLUMN_BACKFILLS = {
+    ("player", "tournament_id"):
+        "UPDATE player SET tournament_id = (SELECT tournament_id FROM team WHERE team.id = player.team_id)",
+}
+
+
+def create_schema():
+    # new tables, then the columns / indexes an older database is missing
+    db.create_all()
+    return upgrade_schema()
+
+
+def upgrade_schema(engine=None):
+    # returns a list of the changes applied, e.g. ["column delivery.client_seq", "index ix_match_tournament"]
+    engine = engine or db.engine
+    applied = []
+    inspector = db.inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+                if (table, column) in COLUMN_BACKFILLS:
+                    conn.execute(db.text(COLUMN_BACKFILLS[(table, column)]))
+                applied.append(f"column {table}.{column}")
+    for table in db.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)} if table.name in tables else set()
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine, checkfirst=True)
+                applied.append(f"index {index.name}")
+    return applied
+
+
+# ─────────────────────────────────────────
+# SQLite production mode (DB_MODE=production)
+# ─────────────────────────────────────────
+# WAL lets spectator reads run alongside the delivery writer instead of queueing
+# behind it; synchronous=NORMAL is durable across app crashes in WAL mode (only an
+# OS crash can lose the last commits). Applied to every new pooled connection.
+SQLITE_PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", "5000"),
+    ("cache_size", "-65536"),  # KiB, i.e. 64 MB of page cache per connection
+    ("mmap_size", str(256 * 1024 * 1024)),
+    ("temp_store", "MEMORY"),
+]
+
+
+def enable_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @db.event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas:
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
 
 
-def top_bowlers_for_team(team_id):
-    result = db.session.query(
-        Player.name,
-        db.func.count(Delivery.id).label("total_wickets")
-    ).join(Delivery, Player.id == Delivery.bowler_id) \
-     .filter(Player.team_id == team_id, Delivery.wicket == True) \
-     .group_by(Player.id) \
-     .order_by(db.desc("total_wickets")) \
-     .limit(5).all()
-    return result
+def sqlite_pragma_values(names=("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size")):
+    with db.engine.connect() as conn:
+        return {name: conn.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
@@ -0,0 +1,100 @@
+# query_plans.py
+# EXPLAIN QUERY PLAN report for the queries behind each hot route, with timings
+# taken with and without the secondary indexes declared in models.py.
+import time
+from statistics import median
+
+from models import db, Tournament, Team, Player, Match, Delivery, InningsAggregate, BallEvent
+
+
+def route_queries(tid, team_id, match_id, team_ids):
+    # (route, description, statement) mirroring what the views run
+    return [
+        ("index", "tournaments newest first",
+         db.select(Tournament).order_by(Tournament.created_at.desc())),
+        ("tournament_home", "teams of tournament",
+         db.select(Team).where(Team.tournament_id == tid)),
+        ("tournament_home", "matches of tournament",
+         db.select(Match).where(Match.tournament_id == tid)),
+        ("team_stats", "players of team",
+         db.select(Player).where(Player.team_id == team_id)),
+        ("team_stats", "matches involving team",
+         db.select(Match).where((Match.teamA_id == team_id) | (Match.teamB_id == team_id))),
+        ("scoreboard", "top run scorers",
+         db.select(Player).where(Player.tournament_id == tid)
+         .order_by(Player.runs.desc(), Player.id.desc()).limit(21)),
+        ("scoreboard", "top wicket takers",
+         db.select(Player).where(Player.tournament_id == tid)
+         .order_by(Player.wickets.desc(), Player.id.desc()).limit(21)),
+        ("api_leaders", "strike rate, qualified",
+         db.select(Player).where(Player.tournament_id == tid, Player.strike_rate.isnot(None),
+                                 Player.balls_faced >= 30)
+         .order_by(Player.strike_rate.desc(), Player.id.desc()).limit(21)),
+        ("api_leaders", "economy, next page",
+         db.select(Player).where(Player.tournament_id == tid, Player.economy.isnot(None),
+                                 Player.balls_bowled >= 60,
+                                 db.or_(Player.economy > 7.5, db.and_(Player.economy == 7.5, Player.id > 0)))
+         .order_by(Player.economy.asc(), Player.id.asc()).limit(21)),
+        ("match_details", "both rosters",
+         db.select(Player).where(Player.team_id.in_(team_ids))),
+        ("api_get_score", "innings aggregates",
+         db.select(InningsAggregate).where(InningsAggregate.match_id == match_id)),
+        ("api_get_score", "last 50 balls",
+         db.select(Delivery).where(Delivery.match_id == match_id)
+         .order_by(Delivery.created_at.desc(), Delivery.id.desc()).limit(50)),
+        ("api_stream", "latest ball id",
+         db.select(db.func.max(Delivery.id)).where(Delivery.match_id == match_id)),
+        ("get_ball_by_ball", "legacy ball events",
+         db.select(BallEvent.payload).where(BallEvent.match_id == match_id).order_by(BallEvent.seq)),
+        ("rebuild-aggregates", "full ball log of match",
+         db.select(Delivery).where(Delivery.match_id == match_id)
+         .order_by(Delivery.created_at.asc(), Delivery.id.asc())),
+    ]
+
+
+def _sql(stmt):
+    return str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+
+
+def _uses_index(plan):
+    # every table access must go through an index / rowid lookup, no bare "SCAN <table>"
+    accesses = [p for p in plan if p.startswith(("SCAN", "SEARCH"))]
+    return bool(accesses) and all(
+        "INDEX" in p or "PRIMARY KEY" in p for p in accesses
+    )
+
+
+def _time(sql, repeat):
+    samples = []
+    with db.engine.connect() as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.exec_driver_sql(sql).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    return round(median(samples), 3)
+
+
+def secondary_indexes():
+    return [ix for table in db.metadata.sorted_tables for ix in table.indexes if not ix.unique]
+
+
+def explain_report(tid, team_id, match_id, team_ids, repeat=5, compare=True):
+    rows = []
+    for route, what, stmt in route_queries(tid, team_id, match_id, team_ids):
+        sql = _sql(stmt)
+        with db.engine.connect() as conn:
+            plan = [r[3] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+        rows.append({"route": route, "query": what, "plan": plan,
+                     "uses_index": _uses_index(plan), "ms": _time(sql, repeat), "sql": sql})
+
+    if compare:
+        indexes = secondary_indexes()
+        for ix in indexes:
+            ix.drop(bind=db.engine, checkfirst=True)
+        try:
+            for row in rows:
+                row["ms_without_indexes"] = _time(row["sql"], repeat)
+        finally:
+            for ix in indexes:
+                ix.create(bind=db.engine, checkfirst=True)
+    return rows
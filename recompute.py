@@ -0,0 +1,134 @@
+# recompute.py
+# Rebuilds the Player career counters from the Delivery log. The counters are bumped
+# in place by several routes and drift; this derives the expected values with two
+# grouped aggregates (batting by striker, bowling by bowler), using the same policy
+# as scoring.add_stat_deltas. Big scopes are split by match across a process pool
+# and the partial sums merged. Returns the players whose stored counters differ;
+# with apply=True those rows are rewritten.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from models import db, Team, Player, Match, Delivery
+from scoring import ILLEGAL_EXTRAS, PLAYER_STAT_FIELDS
+from standings import bump_version
+
+MATCH_CHUNK = 200
+
+
+def _stat_queries(match_ids):
+    legal = db.case((db.func.coalesce(Delivery.extras, "").in_(ILLEGAL_EXTRAS), 0), else_=1)
+    runs = db.func.coalesce(Delivery.runs, 0)
+    wicket = db.case((Delivery.wicket == True, 1), else_=0)  # noqa: E712
+    batting = db.select(
+        Delivery.striker_id, db.func.sum(runs), db.func.sum(legal), db.func.sum(wicket),
+    ).where(Delivery.match_id.in_(match_ids), Delivery.striker_id.isnot(None)) \
+     .group_by(Delivery.striker_id)
+    bowling = db.select(
+        Delivery.bowler_id, db.func.sum(runs), db.func.sum(legal),
+        db.func.sum(wicket),
+    ).where(Delivery.match_id.in_(match_ids), Delivery.bowler_id.isnot(None)) \
+     .group_by(Delivery.bowler_id)
+    return batting, bowling
+
+
+def chunk_stats(conn, match_ids):
+    # -> {player_id: {field: total}} for the deliveries of these matches
+    stats = {}
+    batting, bowling = _stat_queries(match_ids)
+    for pid, runs, balls, outs in conn.execute(batting):
+        st = stats.setdefault(pid, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        st["runs"] += runs or 0
+        st["balls_faced"] += balls or 0
+        st["dismissals"] += outs or 0
+    for pid, conceded, balls, wickets in conn.execute(bowling):
+        st = stats.setdefault(pid, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        st["runs_conceded"] += conceded or 0
+        st["balls_bowled"] += balls or 0
+        st["wickets"] += wickets or 0
+    return stats
+
+
+def _chunk_worker(db_url, match_ids):
+    # runs in a pool process: own engine, no app or session
+    engine = create_engine(db_url, poolclass=NullPool)
+    try:
+        with engine.connect() as conn:
+            return chunk_stats(conn, match_ids)
+    finally:
+        engine.dispose()
+
+
+def merge_stats(total, part):
+    for pid, st in part.items():
+        acc = total.setdefault(pid, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        for f, v in st.items():
+            acc[f] += v
+    return total
+
+
+def delivery_match_ids(tid=None):
+    q = db.session.query(Delivery.match_id).distinct()
+    if tid is not None:
+        q = q.join(Match, Match.id == Delivery.match_id).filter(Match.tournament_id == tid)
+    return sorted(mid for (mid,) in q)
+
+
+def compute_player_stats(tid=None, workers=None, chunk_size=MATCH_CHUNK):
+    match_ids = delivery_match_ids(tid)
+    chunks = [match_ids[i:i + chunk_size] for i in range(0, len(match_ids), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    engine = db.session.get_bind()  # the tournament's shard in sharded storage
+    url = engine.url
+    in_memory = url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+    stats = {}
+    if len(chunks) <= 1 or workers <= 1 or in_memory:
+        with engine.connect() as conn:
+            for chunk in chunks:
+                merge_stats(stats, chunk_stats(conn, chunk))
+        return stats
+
+    db_url = url.render_as_string(hide_password=False)
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        for part in pool.map(_chunk_worker, [db_url] * len(chunks), chunks):
+            merge_stats(stats, part)
+    return stats
+
+
+def recompute_player_stats(tid=None, workers=None, apply=False, chunk_size=MATCH_CHUNK):
+    # -> [{"player_id", "name", "tournament_id", "stored": {...}, "expected": {...}}], differing fields only
+    expected = compute_player_stats(tid, workers=workers, chunk_size=chunk_size)
+    zero = dict.fromkeys(PLAYER_STAT_FIELDS, 0)
+
+    q = db.session.query(Player.id, Player.name, Team.tournament_id,
+                         *[getattr(Player, f) for f in PLAYER_STAT_FIELDS]) \
+        .join(Team, Team.id == Player.team_id)
+    if tid is not None:
+        q = q.filter(Team.tournament_id == tid)
+
+    mismatches = []
+    for row in q.order_by(Player.id):
+        pid, name, player_tid = row[:3]
+        stored = dict(zip(PLAYER_STAT_FIELDS, (v or 0 for v in row[3:])))
+        want = expected.get(pid, zero)
+        diff = [f for f in PLAYER_STAT_FIELDS if stored[f] != want[f]]
+        if diff:
+            mismatches.append({
+                "player_id": pid, "name": name, "tournament_id": player_tid,
+                "stored": {f: stored[f] for f in diff},
+                "expected": {f: want[f] for f in diff},
+            })
+
+    if apply and mismatches:
+        stmt = db.update(Player.__table__) \
+            .where(Player.__table__.c.id == db.bindparam("pid")) \
+            .values(**{f: db.bindparam(f"v_{f}") for f in PLAYER_STAT_FIELDS})
+        db.session.execute(stmt, [
+            {"pid": mm["player_id"], **{f"v_{f}": v for f, v in expected.get(mm["player_id"], zero).items()}}
+            for mm in mismatches
+        ])
+        for player_tid in sorted({mm["tournament_id"] for mm in mismatches}):
+            bump_version(player_tid, standings_changed=False)
+    return mismatches
@@ -0,0 +1,149 @@
+# scheduler.py
+# Deterministic fixture generation.
+#  - circle method (Berger tables) for full or partial round robins: every team plays
+#    exactly matches_per_team games and each round is a set of disjoint pairs;
+#  - a circulant ("balanced incomplete") variant for odd team counts, where partial
+#    circle rounds would leave the teams that had byes one game short;
+#  - a day/venue packer that respects rest days and venue capacity.
+# Everything is O(teams * matches_per_team) plus the packing, so thousands of teams
+# schedule in milliseconds.
+from collections import namedtuple
+from datetime import date, timedelta
+
+Fixture = namedtuple("Fixture", "round day venue home away")
+
+
+def circle_round(teams, r):
+    # round r (0-based) of the circle method; teams must have even length
+    # (pad with None for a bye). Home/away alternates so nobody is always "A".
+    n = len(teams)
+    m = n - 1
+    line = [teams[0]] + [teams[1 + (p - r) % m] for p in range(m)]
+    pairs = []
+    for i in range(n // 2):
+        a, b = line[i], line[n - 1 - i]
+        if a is None or b is None:
+            continue
+        pairs.append((a, b) if (r + i) % 2 == 0 else (b, a))
+    return pairs
+
+
+def circle_rounds(team_ids, rounds=None):
+    teams = list(team_ids)
+    if len(teams) % 2:
+        teams.append(None)
+    total = len(teams) - 1
+    rounds = total if rounds is None else min(rounds, total)
+    return [circle_round(teams, r) for r in range(rounds)]
+
+
+def _circulant_pairs(team_ids, k):
+    # k-regular pairing for an odd number of teams: team i meets i±1 .. i±k/2.
+    # For odd k (n*k odd, so one team must end a game short) add a near-perfect
+    # matching taken from alternate edges of the offset-(n-1)/2 cycle.
+    teams = list(team_ids)
+    n = len(teams)
+    pairs = []
+    for d in range(1, k // 2 + 1):
+        for i in range(n):
+            pairs.append((teams[i], teams[(i + d) % n]))
+    if k % 2:
+        step = (n - 1) // 2
+        for j in range(0, n - 1, 2):
+            pairs.append((teams[(j * step) % n], teams[((j + 1) * step) % n]))
+    return pairs
+
+
+def _pack_rounds(pairs):
+    # greedy first-fit of pairs into rounds with no team twice in a round
+    rounds, busy = [], []
+    for a, b in pairs:
+        for r, used in enumerate(busy):
+            if a not in used and b not in used:
+                rounds[r].append((a, b))
+                used.update((a, b))
+                break
+        else:
+            rounds.append([(a, b)])
+            busy.append({a, b})
+    return rounds
+
+
+def fixture_rounds(team_ids, matches_per_team=3):
+    # list of rounds, each a list of (home, away); full legs of a round robin first
+    # (home/away swapped on every second leg), then a partial leg for the remainder
+    teams = sorted(set(team_ids))
+    n = len(teams)
+    if n < 2 or matches_per_team < 1:
+        return []
+    per_leg = n - 1
+    legs, rest = divmod(matches_per_team, per_leg)
+
+    rounds = []
+    for leg in range(legs):
+        for pairs in circle_rounds(teams):
+            rounds.append([(b, a) for a, b in pairs] if leg % 2 else pairs)
+    if rest:
+        if n % 2 == 0 or rest == per_leg:
+            rounds.extend(circle_rounds(teams, rest))
+        else:
+            rounds.extend(_pack_rounds(_circulant_pairs(teams, rest)))
+    return rounds
+
+
+def fixture_pairs(team_ids, matches_per_team=3):
+    return [pair for rnd in fixture_rounds(team_ids, matches_per_team) for pair in rnd]
+
+
+class _DayAllocator:
+    # finds the first day >= d that still has a free slot (union-find over full days)
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.load = {}
+        self.skip = {}
+
+    def _find(self, d):
+        path = []
+        while d in self.skip:
+            path.append(d)
+            d = self.skip[d]
+        for p in path:
+            self.skip[p] = d
+        return d
+
+    def take(self, earliest):
+        d = self._find(earliest)
+        slot = self.load.get(d, 0)
+        self.load[d] = slot + 1
+        if self.capacity and slot + 1 >= self.capacity:
+            self.skip[d] = d + 1
+        return d, slot
+
+
+def build_schedule(team_ids, matches_per_team=3, venues=None, rest_days=0, slots_per_venue=1):
+    # -> [Fixture]; day is 0-based. With venues, each venue hosts slots_per_venue games a day;
+    # a team never plays twice within rest_days days. Without venues, days follow the
+    # rounds (capacity unlimited) and venue is None.
+    venues = list(venues or [])
+    capacity = len(venues) * slots_per_venue if venues else 0
+    allocator = _DayAllocator(capacity)
+    next_free = {}  # team -> first day it may play again
+    fixtures = []
+    for r, pairs in enumerate(fixture_rounds(team_ids, matches_per_team)):
+        for home, away in pairs:
+            earliest = max(next_free.get(home, 0), next_free.get(away, 0))
+            # with a round-per-day layout, a team's rounds are already on distinct days
+            day, slot = allocator.take(earliest)
+            next_free[home] = next_free[away] = day + 1 + rest_days
+            venue = venues[slot // slots_per_venue] if venues else None
+            fixtures.append(Fixture(r, day, venue, home, away))
+    fixtures.sort(key=lambda f: (f.day, f.round))
+    return fixtures
+
+
+def fixture_label(day, start_date=None, days_between=1):
+    if start_date is None:
+        return f"Day {day + 1}"
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date)
+    return (start_date + timedelta(days=day * days_between)).isoformat()
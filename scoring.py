@@ -0,0 +1,469 @@
+# scoring.py
+# Innings aggregates: running totals that post_delivery keeps up to date so the
+# score API reads a row per innings instead of re-summing the Delivery log.
+# At every over boundary the aggregate's state is checkpointed, so correcting a
+# ball replays the innings from the start of its over, not from the first ball.
+import json
+from models import db, Player, Delivery, InningsAggregate, InningsCheckpoint, BallEvent
+
+ILLEGAL_EXTRAS = ("WD", "NB")
+PLAYER_STAT_FIELDS = ("runs", "balls_faced", "dismissals", "wickets", "balls_bowled", "runs_conceded")
+
+
+def is_legal(extras):
+    return (extras or "") not in ILLEGAL_EXTRAS
+
+
+def ball_symbol(d):
+    runs = d.runs or 0
+    if d.wicket:
+        return "W"
+    if d.extras:
+        return f"{runs}{d.extras}"
+    return str(runs)
+
+
+def _opt_int(val):
+    return int(val) if val else None
+
+
+def _position(data, key, default):
+    value = int(data.get(key, default))
+    if value < 0:
+        raise ValueError(f"{key} must not be negative")
+    return value
+
+
+def parse_delivery(match_id, data):
+    # raises on a bad payload; the caller turns that into a 400
+    if not isinstance(data, dict):
+        raise ValueError("delivery must be an object")
+    client_seq = data.get('client_seq')
+    return Delivery(
+        match_id=match_id,
+        over=_position(data, 'over', 0),
+        ball_in_over=_position(data, 'ball_in_over', 1),
+        batting_team_id=_opt_int(data.get('batting_team_id')),
+        bowling_team_id=_opt_int(data.get('bowling_team_id')),
+        striker_id=_opt_int(data.get('striker_id')),
+        non_striker_id=_opt_int(data.get('non_striker_id')),
+        bowler_id=_opt_int(data.get('bowler_id')),
+        runs=int(data.get('runs', 0)),
+        extras=data.get('extras', '') or '',
+        wicket=bool(data.get('wicket', False)),
+        wicket_type=data.get('wicket_type', '') or '',
+        client_seq=int(client_seq) if client_seq is not None else None,
+    )
+
+
+def add_stat_deltas(deltas, d, sign=1):
+    # same policy post_delivery has always used for Player counters; sign=-1 takes a ball back out
+    legal = is_legal(d.extras)
+    if d.striker_id:
+        st = deltas.setdefault(d.striker_id, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        st["runs"] += sign * (d.runs or 0)
+        if legal:
+            st["balls_faced"] += sign
+        if d.wicket:
+            st["dismissals"] += sign
+    if d.bowler_id:
+        bw = deltas.setdefault(d.bowler_id, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        bw["runs_conceded"] += sign * (d.runs or 0)
+        if legal:
+            bw["balls_bowled"] += sign
+        if d.wicket:
+            bw["wickets"] += sign
+    return deltas
+
+
+def apply_stat_deltas(deltas):
+    # one set-based UPDATE per player, no read-modify-write
+    for player_id, delta in deltas.items():
+        values = {f: db.func.coalesce(getattr(Player, f), 0) + v for f, v in delta.items() if v}
+        if values:
+            db.session.execute(db.update(Player).where(Player.id == player_id).values(**values))
+
+
+def delivery_to_dict(d):
+    return {
+        "id": d.id,
+        "over": d.over,
+        "ball": d.ball_in_over,
+        "batting_team_id": d.batting_team_id,
+        "bowling_team_id": d.bowling_team_id,
+        "striker_id": d.striker_id,
+        "non_striker_id": d.non_striker_id,
+        "bowler_id": d.bowler_id,
+        "runs": d.runs or 0,
+        "extras": d.extras or "",
+        "wicket": bool(d.wicket),
+        "wicket_type": d.wicket_type or "",
+    }
+
+
+def new_innings(match_id, batting_team_id, bowling_team_id=None):
+    return InningsAggregate(
+        match_id=match_id, batting_team_id=batting_team_id, bowling_team_id=bowling_team_id,
+        runs=0, wickets=0, legal_balls=0, deliveries=0, extras="{}",
+        current_over=None, current_over_balls="[]", last_over="{}"
+    )
+
+
+def get_or_create_innings(match_id, batting_team_id, bowling_team_id=None):
+    agg = InningsAggregate.query.filter_by(match_id=match_id, batting_team_id=batting_team_id).first()
+    if agg is None:
+        agg = new_innings(match_id, batting_team_id, bowling_team_id)
+        db.session.add(agg)
+    return agg
+
+
+def apply_delivery(agg, d):
+    # fold one ball into the running innings state (same rules as match_score_summary)
+    runs = d.runs or 0
+    agg.runs = (agg.runs or 0) + runs
+    agg.deliveries = (agg.deliveries or 0) + 1
+    if d.wicket:
+        agg.wickets = (agg.wickets or 0) + 1
+    if is_legal(d.extras):
+        agg.legal_balls = (agg.legal_balls or 0) + 1
+    if d.extras:
+        extras = agg.extras_dict()
+        extras[d.extras] = extras.get(d.extras, 0) + runs
+        agg.extras = json.dumps(extras)
+
+    if d.bowling_team_id:
+        agg.bowling_team_id = d.bowling_team_id
+    agg.striker_id = d.striker_id
+    agg.non_striker_id = d.non_striker_id
+    agg.bowler_id = d.bowler_id
+
+    # over tracking: when a new over starts, the finished one becomes last_over
+    try:
+        balls = json.loads(agg.current_over_balls or "[]")
+    except Exception:
+        balls = []
+    if agg.current_over is not None and d.over != agg.current_over:
+        agg.last_over = json.dumps({
+            "over": agg.current_over,
+            "balls": balls,
+            "runs": sum(b["runs"] for b in balls),
+            "wickets": sum(1 for b in balls if b["wicket"]),
+        })
+        balls = []
+    agg.current_over = d.over
+    balls.append({"ball": d.ball_in_over, "runs": runs, "wicket": bool(d.wicket), "symbol": ball_symbol(d)})
+    agg.current_over_balls = json.dumps(balls)
+    if d.id is not None:
+        agg.last_delivery_id = d.id
+    return agg
+
+
+# the InningsAggregate columns a checkpoint captures (everything apply_delivery moves)
+CHECKPOINT_FIELDS = (
+    "bowling_team_id", "runs", "wickets", "legal_balls", "deliveries", "extras",
+    "striker_id", "non_striker_id", "bowler_id",
+    "current_over", "current_over_balls", "last_over", "last_delivery_id",
+)
+
+
+def over_checkpoint(agg, d):
+    # call before apply_delivery: a ball that starts a new over snapshots the state so far
+    if agg.current_over is None or d.over == agg.current_over:
+        return None
+    return {
+        "match_id": agg.match_id, "batting_team_id": agg.batting_team_id,
+        "seq": agg.deliveries or 0, "over": d.over,
+        "state": json.dumps({f: getattr(agg, f) for f in CHECKPOINT_FIELDS}),
+    }
+
+
+def save_checkpoints(rows):
+    rows = [r for r in rows if r]
+    if rows:
+        db.session.execute(db.insert(InningsCheckpoint), rows)
+
+
+def record_delivery(d):
+    # called from post_delivery inside the same transaction as the Delivery insert
+    agg = get_or_create_innings(d.match_id, d.batting_team_id, d.bowling_team_id)
+    save_checkpoints([over_checkpoint(agg, d)])
+    return apply_delivery(agg, d)
+
+
+def existing_client_seqs(match_id, seqs):
+    seqs = [s for s in seqs if s is not None]
+    if not seqs:
+        return {}
+    rows = db.session.query(Delivery.client_seq, Delivery.id) \
+        .filter(Delivery.match_id == match_id, Delivery.client_seq.in_(seqs)).all()
+    return {seq: did for seq, did in rows}
+
+
+def ingest_batch(match_id, deliveries):
+    # deliveries: parsed, unsaved Delivery objects in scoring order, none already stored.
+    # Bulk insert, fold into aggregates, apply summed player deltas; caller commits.
+    if not deliveries:
+        return [], {}
+    rows = [{c.name: getattr(d, c.name) for c in Delivery.__table__.columns if c.name != "id"} for d in deliveries]
+    for row in rows:
+        row.pop("created_at", None)
+    db.session.execute(db.insert(Delivery), rows)
+
+    seqs = [d.client_seq for d in deliveries]
+    ids = existing_client_seqs(match_id, seqs)
+    for d in deliveries:
+        d.id = ids.get(d.client_seq)
+
+    innings = {}
+    deltas = {}
+    checkpoints = []
+    for d in deliveries:
+        agg = innings.get(d.batting_team_id)
+        if agg is None:
+            agg = innings[d.batting_team_id] = get_or_create_innings(match_id, d.batting_team_id, d.bowling_team_id)
+        checkpoints.append(over_checkpoint(agg, d))
+        apply_delivery(agg, d)
+        add_stat_deltas(deltas, d)
+    apply_stat_deltas(deltas)
+    save_checkpoints(checkpoints)
+    return deliveries, innings
+
+
+def latest_delivery_id(match_id):
+    return db.session.query(db.func.max(Delivery.id)).filter(Delivery.match_id == match_id).scalar()
+
+
+def match_innings(match_id):
+    rows = InningsAggregate.query.filter_by(match_id=match_id).order_by(InningsAggregate.id.asc()).all()
+    return {str(a.batting_team_id): a.to_dict() for a in rows}
+
+
+# ----------------------
+# Corrections: edit / delete one delivery, replaying its innings from the nearest
+# over checkpoint at or before the changed ball
+# ----------------------
+EDITABLE_FIELDS = (
+    "over", "ball_in_over", "batting_team_id", "bowling_team_id", "striker_id", "non_striker_id",
+    "bowler_id", "runs", "extras", "wicket", "wicket_type",
+)
+
+
+def innings_position(d):
+    # 0-based index of d among its innings' deliveries, in scoring order
+    return db.session.query(db.func.count(Delivery.id)).filter(
+        Delivery.match_id == d.match_id, Delivery.batting_team_id == d.batting_team_id,
+        db.tuple_(Delivery.created_at, Delivery.id) < db.tuple_(d.created_at, d.id)).scalar()
+
+
+def replay_innings(match_id, batting_team_id, position):
+    # recompute the aggregate given that every ball before `position` is unchanged;
+    # returns (aggregate or None if the innings has no balls left, balls replayed)
+    cp = InningsCheckpoint.query.filter(
+        InningsCheckpoint.match_id == match_id, InningsCheckpoint.batting_team_id == batting_team_id,
+        InningsCheckpoint.seq <= position,
+    ).order_by(InningsCheckpoint.seq.desc(), InningsCheckpoint.id.desc()).first()
+
+    agg = InningsAggregate.query.filter_by(match_id=match_id, batting_team_id=batting_team_id).first()
+    if agg is None:
+        agg = new_innings(match_id, batting_team_id)
+        db.session.add(agg)
+    start = new_innings(match_id, batting_team_id)
+    state = json.loads(cp.state) if cp else {f: getattr(start, f) for f in CHECKPOINT_FIELDS}
+    for f in CHECKPOINT_FIELDS:
+        setattr(agg, f, state.get(f))
+    seq = cp.seq if cp else 0
+
+    # this and later checkpoints may sit on shifted over boundaries; the replay re-takes them
+    db.session.execute(db.delete(InningsCheckpoint).where(
+        InningsCheckpoint.match_id == match_id, InningsCheckpoint.batting_team_id == batting_team_id,
+        InningsCheckpoint.seq >= seq))
+    deliveries = Delivery.query.filter_by(match_id=match_id, batting_team_id=batting_team_id) \
+        .order_by(Delivery.created_at.asc(), Delivery.id.asc()).offset(seq).all()
+    checkpoints = []
+    for d in deliveries:
+        checkpoints.append(over_checkpoint(agg, d))
+        apply_delivery(agg, d)
+    save_checkpoints(checkpoints)
+
+    if not agg.deliveries:
+        db.session.delete(agg)
+        return None, 0
+    return agg, len(deliveries)
+
+
+def correct_delivery(d, changes=None):
+    # changes=None deletes the ball. Player counters get the old ball's stats taken
+    # out and the new ones added; every innings the ball was or is in is replayed.
+    # Returns {batting_team_id: aggregate or None}; the caller bumps versions and commits.
+    match_id = d.match_id
+    deltas = add_stat_deltas({}, d, sign=-1)
+    touched = {d.batting_team_id: innings_position(d)}
+    if changes is None:
+        db.session.delete(d)
+    else:
+        payload = {f: getattr(d, f) for f in EDITABLE_FIELDS}
+        payload.update({k: v for k, v in changes.items() if k in EDITABLE_FIELDS})
+        fresh = parse_delivery(match_id, payload)  # raises on a bad payload
+        for f in EDITABLE_FIELDS:
+            setattr(d, f, getattr(fresh, f))
+        add_stat_deltas(deltas, d)
+    db.session.flush()
+    if changes is not None and d.batting_team_id not in touched:
+        touched[d.batting_team_id] = innings_position(d)
+
+    apply_stat_deltas(deltas)
+    return {team_id: replay_innings(match_id, team_id, pos)[0] for team_id, pos in touched.items()}
+
+
+# ----------------------
+# Rebuild / verification from the Delivery log
+# ----------------------
+def compute_innings_from_log(match_id, checkpoints=None):
+    # checkpoints: optional list collecting the over checkpoints of the replay
+    aggs = {}
+    deliveries = Delivery.query.filter_by(match_id=match_id) \
+        .order_by(Delivery.created_at.asc(), Delivery.id.asc()).all()
+    for d in deliveries:
+        agg = aggs.get(d.batting_team_id)
+        if agg is None:
+            agg = aggs[d.batting_team_id] = new_innings(match_id, d.batting_team_id, d.bowling_team_id)
+        if checkpoints is not None:
+            checkpoints.append(over_checkpoint(agg, d))
+        apply_delivery(agg, d)
+    return aggs
+
+
+def rebuild_innings(match_id, check_only=False):
+    # returns a list of mismatch descriptions; with check_only the stored rows are left alone
+    checkpoints = []
+    fresh = compute_innings_from_log(match_id, checkpoints)
+    stored = {a.batting_team_id: a for a in InningsAggregate.query.filter_by(match_id=match_id).all()}
+    mismatches = []
+    for team_id in set(fresh) | set(stored):
+        want = fresh[team_id].to_dict() if team_id in fresh else None
+        have = stored[team_id].to_dict() if team_id in stored else None
+        if want != have:
+            mismatches.append({"match_id": match_id, "batting_team_id": team_id, "expected": want, "stored": have})
+
+    if not check_only and mismatches:
+        for a in stored.values():
+            db.session.delete(a)
+        db.session.flush()
+        for a in fresh.values():
+            db.session.add(a)
+        InningsCheckpoint.query.filter_by(match_id=match_id).delete()
+        save_checkpoints(checkpoints)
+    return mismatches
+
+
+# ----------------------
+# Legacy ball_by_ball storage: one BallEvent row per ball instead of
+# rewriting the whole Match.ball_by_ball JSON blob on every append
+# ----------------------
+def _blob_list(text):
+    try:
+        bbb = json.loads(text or "[]")
+    except Exception:
+        return []
+    return bbb if isinstance(bbb, list) else []
+
+
+def expand_ball_by_ball(m):
+    # moves a match's old JSON blob into BallEvent rows (ahead of any existing rows)
+    bbb = _blob_list(m.ball_by_ball)
+    if not bbb:
+        return 0
+    n = len(bbb)
+    existing = BallEvent.query.filter_by(match_id=m.id).order_by(BallEvent.seq.desc()).all()
+    for ev in existing:  # highest first so the unique (match_id, seq) index never collides
+        ev.seq += n
+        db.session.flush()
+    db.session.execute(db.insert(BallEvent), [
+        {"match_id": m.id, "seq": i, "payload": json.dumps(p)} for i, p in enumerate(bbb, start=1)
+    ])
+    m.ball_by_ball = "[]"
+    return n
+
+
+def append_ball_event(match_id, payload):
+    # the next seq is computed inside the INSERT, so it is read under the write lock
+    # rather than by an earlier SELECT another append could interleave with
+    next_seq = db.select(db.func.coalesce(db.func.max(BallEvent.seq), 0) + 1) \
+        .where(BallEvent.match_id == match_id).scalar_subquery()
+    result = db.session.execute(db.insert(BallEvent).values(
+        match_id=match_id, seq=next_seq, payload=json.dumps(payload)))
+    return db.session.query(BallEvent.seq).filter(BallEvent.id == result.inserted_primary_key[0]).scalar()
+
+
+def _payload_int(val):
+    try:
+        return int(val or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def ball_event_deltas(payload, sign=1):
+    # the Player counter policy of /b2b/add (no-ball flag, numeric extras conceded)
+    deltas = {}
+    batsman_id = payload.get("batsman_id") or payload.get("striker_id")
+    bowler_id = payload.get("bowler_id")
+    runs = _payload_int(payload.get("runs"))
+    extras = payload.get("extras", "")
+    extras_runs = int(extras) if isinstance(extras, (int, float)) or (isinstance(extras, str) and extras.isdigit()) else 0
+    wicket = bool(payload.get("wicket", False))
+    is_no_ball = bool(payload.get("is_no_ball", False))
+    extras_type = payload.get("extras_type") or payload.get("extras_kind") or ""
+
+    if batsman_id:
+        st = deltas.setdefault(batsman_id, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        st["runs"] += sign * runs
+        # only legal deliveries (not no-balls or wides) count as balls faced
+        if not is_no_ball and extras_type not in ("WD",):
+            st["balls_faced"] += sign
+        if wicket:
+            st["dismissals"] += sign
+    if bowler_id:
+        bw = deltas.setdefault(bowler_id, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+        bw["runs_conceded"] += sign * (runs + extras_runs)
+        if extras_type not in ("WD", "NB") and not is_no_ball:
+            bw["balls_bowled"] += sign
+        if wicket:
+            bw["wickets"] += sign
+    return deltas
+
+
+def correct_ball_event(match_id, seq, changes=None):
+    # changes=None deletes the ball; otherwise its payload is updated with them.
+    # -> the BallEvent (None once deleted), or raises LookupError for an unknown seq
+    ev = BallEvent.query.filter_by(match_id=match_id, seq=seq).first()
+    if ev is None:
+        raise LookupError(f"no ball {seq} in match {match_id}")
+    old = json.loads(ev.payload or "{}")
+    deltas = ball_event_deltas(old, sign=-1)
+    if changes is None:
+        db.session.delete(ev)
+        db.session.flush()
+        # close the gap so seq stays the ball's position in the /b2b list; via negative
+        # values, so the unique (match_id, seq) index never sees two rows at once
+        later = (BallEvent.match_id == match_id) & (BallEvent.seq > seq)
+        db.session.execute(db.update(BallEvent).where(later).values(seq=1 - BallEvent.seq),
+                           execution_options={"synchronize_session": False})
+        db.session.execute(db.update(BallEvent).where(BallEvent.match_id == match_id, BallEvent.seq < 0)
+                           .values(seq=-BallEvent.seq), execution_options={"synchronize_session": False})
+        ev = None
+    else:
+        new = dict(old, **changes)
+        for player_id, delta in ball_event_deltas(new).items():
+            st = deltas.setdefault(player_id, dict.fromkeys(PLAYER_STAT_FIELDS, 0))
+            for f, v in delta.items():
+                st[f] += v
+        ev.payload = json.dumps(new)
+    apply_stat_deltas(deltas)
+    return ev
+
+
+def ball_by_ball_list(m):
+    # the list the old API used to return: any unmigrated blob first, then appended rows
+    rows = db.session.query(BallEvent.payload).filter(BallEvent.match_id == m.id) \
+        .order_by(BallEvent.seq.asc()).all()
+    return _blob_list(m.ball_by_ball) + [json.loads(p) for (p,) in rows]
@@ -0,0 +1,173 @@
+# shards.py
+# Optional per-tournament storage (SHARD_DIR). Each tournament's teams, players,
+# matches and deliveries live in their own SQLite file, so a live match only locks
+# its own tournament and finished seasons stay out of everyone else's query plans.
+# The main database becomes the catalog: Tournament rows for the index page, plus
+# the archived flag.
+#
+# Ids are globally unique. Shard tables are AUTOINCREMENT with their sequences
+# seeded at tid * SHARD_ID_STRIDE, so a team / match id alone names its shard.
+# Requests are routed by their tid / mid / match_id / team_id view argument: the
+# engine goes into models.shard_engine, which RoutingSession.get_bind follows.
+# Archived tournaments are opened read-only with immutable=1 (no locks, no WAL).
+import os
+import threading
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import abort, g, request
+
+from models import db, Tournament, shard_engine, enable_sqlite_pragmas, upgrade_schema
+
+SHARD_ID_STRIDE = 10 ** 9  # ids per tournament; tid * stride stays below 2**53 for JS clients
+ROUTE_ARGS = ("tid", "mid", "match_id", "team_id")
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def tid_for_id(row_id):
+    return row_id // SHARD_ID_STRIDE
+
+
+def shard_path(directory, tid):
+    return os.path.join(directory, f"tournament_{tid}.db")
+
+
+def shard_metadata():
+    # the models' tables with AUTOINCREMENT, so sqlite_sequence can offset the ids
+    meta = sa.MetaData()
+    for table in db.metadata.sorted_tables:
+        table.to_metadata(meta).dialect_kwargs["sqlite_autoincrement"] = True
+    return meta
+
+
+class ShardRouter:
+    def __init__(self, directory, production=False, read_only_endpoints=()):
+        self.directory = directory
+        self.production = production
+        # POST routes that only read the tournament (e.g. queueing an export)
+        self.read_only_endpoints = set(read_only_endpoints)
+        self.lock = threading.Lock()
+        self.engines = {}  # tid -> engine
+        self.readonly = set()
+        self.upgrades = {}  # tid -> schema changes applied when the shard was opened
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, tid):
+        return shard_path(self.directory, tid)
+
+    def _create_engine(self, tid, readonly):
+        path = os.path.abspath(self.path(tid))
+        if readonly:
+            return sa.create_engine(f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true")
+        engine = sa.create_engine("sqlite:///" + path)
+        if self.production:
+            enable_sqlite_pragmas(engine)
+        return engine
+
+    def _archived(self, tid):
+        # read from the catalog, whatever shard the caller is routed to
+        with db.engine.connect() as conn:
+            return bool(conn.execute(sa.select(Tournament.archived).where(Tournament.id == tid)).scalar())
+
+    def engine(self, tid):
+        # None for an unknown tournament: queries then go to the catalog and 404 there
+        engine = self.engines.get(tid)
+        if engine is not None or not os.path.exists(self.path(tid)):
+            return engine
+        with self.lock:
+            if tid not in self.engines:
+                readonly = self._archived(tid)
+                engine = self._create_engine(tid, readonly)
+                if readonly:
+                    self.readonly.add(tid)
+                else:
+                    self._prepare(engine, tid)
+                    self.upgrades[tid] = upgrade_schema(engine)
+                self.engines[tid] = engine
+        return self.engines[tid]
+
+    def dispose(self, tid):
+        with self.lock:
+            engine = self.engines.pop(tid, None)
+            self.readonly.discard(tid)
+        if engine is not None:
+            engine.dispose()
+
+    def _prepare(self, engine, tid):
+        # creates missing tables and seeds the id sequence of any table that has none yet
+        meta = shard_metadata()
+        meta.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(sa.text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+                [{"name": table.name, "seq": tid * SHARD_ID_STRIDE} for table in meta.sorted_tables])
+
+    def create_shard(self, t):
+        # t: the catalog Tournament, already committed (its id is the shard key)
+        engine = self._create_engine(t.id, readonly=False)
+        self._prepare(engine, t.id)
+        with engine.begin() as conn:
+            conn.execute(sa.insert(Tournament.__table__).values(
+                id=t.id, name=t.name, created_at=t.created_at, settings=t.settings or "{}",
+                version=0, standings_version=-1, archived=False))
+        with self.lock:
+            self.engines[t.id] = engine
+        return engine
+
+    @contextmanager
+    def use(self, tid):
+        token = shard_engine.set(self.engine(tid))
+        try:
+            yield
+        finally:
+            shard_engine.reset(token)
+
+    def tids(self):
+        # every tournament with a shard file, in catalog order
+        with db.engine.connect() as conn:
+            ids = [tid for (tid,) in conn.execute(sa.select(Tournament.id).order_by(Tournament.id))]
+        return [tid for tid in ids if os.path.exists(self.path(tid))]
+
+    def set_archived(self, tid, archived):
+        # archiving folds the WAL into the main file first: immutable readers never look at -wal
+        with self.use(tid):
+            if archived:
+                from standings import points_table
+                points_table(tid)  # the stored table must be current, readers cannot rebuild it
+                db.session.commit()
+        db.session.remove()
+        self.dispose(tid)
+        if archived:
+            engine = self._create_engine(tid, readonly=False)
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.exec_driver_sql("PRAGMA journal_mode=DELETE")
+            engine.dispose()
+        with db.engine.begin() as conn:
+            conn.execute(sa.update(Tournament).where(Tournament.id == tid).values(archived=archived))
+
+    def route_request(self):
+        args = request.view_args or {}
+        name = next((a for a in ROUTE_ARGS if a in args), None)
+        if name is None:
+            return
+        tid = args[name] if name == "tid" else tid_for_id(args[name])
+        g.shard_token = shard_engine.set(self.engine(tid))
+        if tid in self.readonly and request.method not in READ_METHODS \
+                and request.endpoint not in self.read_only_endpoints:
+            abort(403, description="tournament is archived (read-only)")
+
+    def end_request(self, exc=None):
+        token = g.pop("shard_token", None)
+        if token is not None:
+            shard_engine.reset(token)
+
+
+def init_shards(app, directory, read_only_endpoints=()):
+    router = ShardRouter(directory, production=app.config.get("DB_MODE") == "production",
+                         read_only_endpoints=read_only_endpoints)
+    app.before_request(router.route_request)
+    app.teardown_request(router.end_request)
+    app.extensions["shards"] = router
+    return router
@@ -0,0 +1,186 @@
+# simulate.py
+# Monte Carlo playoff chances. The current standings and the unplayed fixtures are
+# encoded as arrays (team totals, fixture x team incidence matrices); each batch
+# simulates every remaining match for thousands of seasons at once: innings totals
+# are drawn from the two sides' batting/bowling run rates so far, points and NRR
+# totals are accumulated with two matrix products, and the table is ranked with one
+# argsort per batch. Big runs (the simulate-qualification command) are split across
+# a long-lived forkserver process pool; the HTTP API only runs a few fixed sizes in
+# process. Results are cached per (tournament, data version), so a repeated question
+# costs nothing until the next result is recorded.
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from models import Tournament, Match
+from standings import standings_stats, tournament_version
+from utils import overs_to_balls
+
+BATCH_CELLS = 2_000_000  # seasons x fixtures per batch, bounds memory per batch
+MAX_SIMULATIONS = 1_000_000
+DEFAULT_SIGMA = 25.0  # innings-total spread when too few matches have been played
+PARALLEL_THRESHOLD = 200_000
+# sizes a web request may ask for; all stay below PARALLEL_THRESHOLD
+HTTP_SIMULATIONS = (10_000, 50_000, 100_000)
+
+_cache = OrderedDict()  # (tid, version, sims, top_n) -> result
+_cache_lock = threading.Lock()
+MAX_CACHED_RESULTS = 64
+
+_pool = None  # (workers, ProcessPoolExecutor)
+_pool_lock = threading.Lock()
+
+
+def _rate(runs, balls):
+    return np.divide(runs * 6.0, balls, out=np.full(len(runs), np.nan), where=balls > 0)
+
+
+def season_inputs(tid):
+    # -> (teams, arrays dict) describing the table so far and the fixtures left to play
+    tour = Tournament.query.get(tid)
+    overs = int(tour.settings_dict().get("overs") or 20) if tour else 20
+    teams, stats = standings_stats(tid)
+    index = {t.id: i for i, t in enumerate(teams)}
+    fields = ("points", "runs_for", "balls_faced", "runs_against", "balls_bowled")
+    base = {f: np.array([stats[t.id][f] for t in teams], dtype=np.float64) for f in fields}
+
+    played = Match.query.filter_by(tournament_id=tid, played=True) \
+        .with_entities(Match.a_runs, Match.a_overs, Match.b_runs, Match.b_overs).all()
+    per_over = []
+    for a_runs, a_overs, b_runs, b_overs in played:
+        for runs, ov in ((a_runs, a_overs), (b_runs, b_overs)):
+            balls = overs_to_balls(ov)
+            if balls:
+                per_over.append((runs or 0) * 6.0 / balls)
+    sigma = float(np.std(per_over) * overs) if len(per_over) >= 4 else DEFAULT_SIGMA
+
+    remaining = [(index[a], index[b]) for a, b in Match.query.filter_by(tournament_id=tid, played=False)
+                 .with_entities(Match.teamA_id, Match.teamB_id) if a in index and b in index]
+    fa = np.array([a for a, _ in remaining], dtype=np.int64)
+    fb = np.array([b for _, b in remaining], dtype=np.int64)
+
+    # expected runs per over: a side's batting rate against the opponent's bowling,
+    # falling back to the tournament average for teams without a completed innings
+    bat = _rate(base["runs_for"], base["balls_faced"])
+    conceded = _rate(base["runs_against"], base["balls_bowled"])
+    league = float(np.nanmean(bat)) if np.isfinite(bat).any() else 7.5
+    bat = np.where(np.isfinite(bat), bat, league)
+    conceded = np.where(np.isfinite(conceded), conceded, league)
+    return teams, {
+        "base": base, "fa": fa, "fb": fb, "balls": overs * 6, "sigma": sigma,
+        "mu_a": (bat[fa] + conceded[fb]) / 2 * overs, "mu_b": (bat[fb] + conceded[fa]) / 2 * overs,
+    }
+
+
+def simulate_batch(inputs, n, top_n, rng):
+    # -> (top-N finishes per team, first places per team, summed final points per team)
+    base, fa, fb = inputs["base"], inputs["fa"], inputs["fb"]
+    n_teams, n_fix = len(base["points"]), len(fa)
+    balls = inputs["balls"]
+
+    points = np.broadcast_to(base["points"], (n, n_teams)).copy()
+    runs_for = np.broadcast_to(base["runs_for"], (n, n_teams)).copy()
+    runs_against = np.broadcast_to(base["runs_against"], (n, n_teams)).copy()
+    balls_faced = base["balls_faced"].copy()
+    balls_bowled = base["balls_bowled"].copy()
+
+    if n_fix:
+        A = np.zeros((n_fix, n_teams))
+        B = np.zeros((n_fix, n_teams))
+        A[np.arange(n_fix), fa] = 1
+        B[np.arange(n_fix), fb] = 1
+        score_a = np.maximum(0, np.rint(rng.normal(inputs["mu_a"], inputs["sigma"], (n, n_fix))))
+        score_b = np.maximum(0, np.rint(rng.normal(inputs["mu_b"], inputs["sigma"], (n, n_fix))))
+        pts_a = np.where(score_a > score_b, 2, np.where(score_a == score_b, 1, 0))
+        pts_b = 2 - pts_a
+        points += pts_a @ A + pts_b @ B
+        runs_for += score_a @ A + score_b @ B
+        runs_against += score_b @ A + score_a @ B
+        played = A.sum(axis=0) + B.sum(axis=0)
+        balls_faced = balls_faced + played * balls
+        balls_bowled = balls_bowled + played * balls
+
+    nrr = np.nan_to_num(runs_for * 6.0 / np.where(balls_faced > 0, balls_faced, np.inf)) \
+        - np.nan_to_num(runs_against * 6.0 / np.where(balls_bowled > 0, balls_bowled, np.inf))
+    # points first, NRR as tie-break (|NRR| is far below 1000), same order as standings_rows
+    order = np.argsort(-(points * 1000.0 + nrr), axis=1, kind="stable")
+    top = np.bincount(order[:, :top_n].ravel(), minlength=n_teams)
+    first = np.bincount(order[:, 0], minlength=n_teams)
+    return top, first, points.sum(axis=0)
+
+
+def _run_chunk(inputs, n, top_n, seed):
+    rng = np.random.default_rng(seed)
+    batch = max(1000, BATCH_CELLS // max(1, len(inputs["fa"])))
+    top = first = pts = 0
+    done = 0
+    while done < n:
+        size = min(batch, n - done)
+        t, f, p = simulate_batch(inputs, size, top_n, rng)
+        top, first, pts = top + t, first + f, pts + p
+        done += size
+    return top, first, pts
+
+
+def http_simulations(requested):
+    # largest allowed size not above the request (the smallest for tiny requests)
+    allowed = [n for n in HTTP_SIMULATIONS if n <= (requested or 0)]
+    return allowed[-1] if allowed else HTTP_SIMULATIONS[0]
+
+
+def _process_pool(workers):
+    # kept for the life of the process; forkserver children start clean instead of
+    # inheriting the parent's threads, locks and open database handles
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != workers:
+            if _pool is not None:
+                _pool[1].shutdown()
+            context = multiprocessing.get_context("forkserver")
+            _pool = (workers, ProcessPoolExecutor(max_workers=workers, mp_context=context))
+        return _pool[1]
+
+
+def run_simulations(inputs, sims, top_n, seed, workers=None):
+    workers = workers or os.cpu_count() or 1
+    seeds = np.random.SeedSequence(seed)
+    if sims < PARALLEL_THRESHOLD or workers <= 1:
+        return _run_chunk(inputs, sims, top_n, seeds)
+    parts = [sims // workers + (1 if i < sims % workers else 0) for i in range(workers)]
+    results = list(_process_pool(workers).map(_run_chunk, [inputs] * workers, parts, [top_n] * workers,
+                                              seeds.spawn(workers)))
+    return tuple(sum(r[i] for r in results) for i in range(3))
+
+
+def qualification_chances(tid, sims=100_000, top_n=4, workers=None):
+    sims = max(1, min(int(sims), MAX_SIMULATIONS))
+    version = tournament_version(tid)
+    key = (tid, version, sims, top_n)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    teams, inputs = season_inputs(tid)
+    top_n = max(1, min(top_n, len(teams))) if teams else top_n
+    result = {"tournament_id": tid, "version": version, "simulations": sims, "top_n": top_n,
+              "remaining_matches": int(len(inputs["fa"])), "teams": []}
+    if teams:
+        top, first, pts = run_simulations(inputs, sims, top_n, seed=[tid, version or 0], workers=workers)
+        result["teams"] = sorted((
+            {"team_id": t.id, "team_name": t.name,
+             "points": int(inputs["base"]["points"][i]),
+             "qualify": round(float(top[i]) / sims, 4),
+             "top": round(float(first[i]) / sims, 4),
+             "expected_points": round(float(pts[i]) / sims, 2)}
+            for i, t in enumerate(teams)), key=lambda r: (-r["qualify"], -r["expected_points"]))
+
+    with _cache_lock:
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED_RESULTS:
+            _cache.popitem(last=False)
+    return result
@@ -0,0 +1,479 @@
+# spectator.py
+# Async read path for spectators: the score API, the live stream and a scoreboard
+# JSON served by an ASGI app (`uvicorn spectator:app`) next to the Flask app, which
+# keeps every write route. A viewer polling the score or holding a stream open
+# costs a coroutine here instead of a WSGI worker thread.
+#
+# Reads go through aiosqlite connection pools opened read-only, one per database
+# file (one per tournament with SHARD_DIR). Identical concurrent requests are
+# coalesced: the version lookup and the body build run once per key and every
+# waiter shares the result, and a built body is reused until its match / tournament
+# version moves. Streams are fed by one poller per match, whatever the viewer count.
+# Bodies and ETags match the Flask routes, so a proxy can send these GETs here.
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from types import SimpleNamespace
+from urllib.parse import parse_qsl
+
+import aiosqlite
+
+from httpcache import deploy_token, query_tag
+from leaders import player_card
+from live import BACKLOG_SIZE, SUBSCRIBER_QUEUE_SIZE, sse_message
+from models import InningsAggregate
+from scoring import delivery_to_dict
+from shards import shard_path, tid_for_id
+from utils import STANDING_FIELDS, match_contribution, add_contribution, standings_rows
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+DATABASE_URL = os.environ.get("DATABASE_URL") or "sqlite:///" + os.path.join(BASE_DIR, "app.db")
+SHARD_DIR = os.environ.get("SHARD_DIR")
+POOL_SIZE = int(os.environ.get("SPECTATOR_POOL_SIZE", 8))
+POLL_SECONDS = float(os.environ.get("SPECTATOR_POLL_MS", 250)) / 1000.0
+HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+HTTP_CACHE_MAX_AGE = int(os.environ.get("HTTP_CACHE_MAX_AGE", 0))
+ETAG_SALT = os.environ.get("ETAG_SALT") or deploy_token(BASE_DIR)
+RECENT_DELIVERIES = 50
+LEADERS_LIMIT = 20
+MAX_CACHED_BODIES = 1024
+
+INNINGS_COLUMNS = (
+    "batting_team_id", "bowling_team_id", "runs", "wickets", "legal_balls", "deliveries", "extras",
+    "striker_id", "non_striker_id", "bowler_id", "current_over_balls", "last_over",
+)
+DELIVERY_COLUMNS = (
+    "id", "over", "ball_in_over", "batting_team_id", "bowling_team_id", "striker_id",
+    "non_striker_id", "bowler_id", "runs", "extras", "wicket", "wicket_type",
+)
+PLAYER_COLUMNS = (
+    "id", "name", "team_id", "runs", "balls_faced", "dismissals", "strike_rate", "batting_average",
+    "wickets", "balls_bowled", "runs_conceded", "economy", "bowling_strike_rate",
+)
+
+
+def _sqlite_path(url):
+    # same resolution as Flask-SQLAlchemy: relative paths live in the instance folder
+    path = url[len("sqlite:///"):]
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, "instance", path)
+
+
+# ----------------------
+# Connection pools and request coalescing
+# ----------------------
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE, immutable=False):
+        self.uri = f"file:{path}?mode=ro" + ("&immutable=1" if immutable else "")
+        self.size = size
+        self.idle = []
+        self.opened = 0
+        self.slots = asyncio.Semaphore(size)
+
+    async def _acquire(self):
+        await self.slots.acquire()
+        if self.idle:
+            return self.idle.pop()
+        try:
+            conn = await aiosqlite.connect(self.uri, uri=True)
+        except Exception:
+            self.slots.release()
+            raise
+        conn.row_factory = aiosqlite.Row
+        self.opened += 1
+        return conn
+
+    async def fetchall(self, sql, params=()):
+        conn = await self._acquire()
+        try:
+            async with conn.execute(sql, params) as cur:
+                return await cur.fetchall()
+        finally:
+            self.idle.append(conn)
+            self.slots.release()
+
+    async def fetchone(self, sql, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    async def close(self):
+        while self.idle:
+            await self.idle.pop().close()
+
+
+class Coalescer:
+    # concurrent calls with the same key share one in-flight coroutine
+    def __init__(self):
+        self.inflight = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def run(self, key, make):
+        self.calls += 1
+        task = self.inflight.get(key)
+        if task is None:
+            task = self.inflight[key] = asyncio.ensure_future(make())
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        else:
+            self.shared += 1
+        # shield: one cancelled viewer must not cancel the query the others wait on
+        return await asyncio.shield(task)
+
+
+_pools = {}  # database path -> ConnectionPool
+coalescer = Coalescer()
+_bodies = OrderedDict()  # (route, key) -> (version, body)
+
+
+async def pool_for(tid=None):
+    # the catalog (or single) database, or tid's shard; like ShardRouter.engine, a
+    # tournament without a shard file (legacy rows, pre-sharding data) reads the catalog
+    if SHARD_DIR and tid is not None:
+        path = shard_path(SHARD_DIR, tid)
+        if path not in _pools:
+            if not os.path.exists(path):
+                return await pool_for()
+            row = await (await pool_for()).fetchone("SELECT archived FROM tournament WHERE id = ?", (tid,))
+            _pools.setdefault(path, ConnectionPool(path, immutable=bool(row and row["archived"])))
+        return _pools[path]
+    path = _sqlite_path(DATABASE_URL)
+    return _pools.setdefault(path, ConnectionPool(path))
+
+
+async def cached_body(route, key, version, build):
+    # the serialized body for this version, built once however many requests ask
+    hit = _bodies.get((route, key))
+    if hit is not None and hit[0] == version:
+        _bodies.move_to_end((route, key))
+        return hit[1]
+    body = await coalescer.run((route, key, version), build)
+    _bodies[(route, key)] = (version, body)
+    while len(_bodies) > MAX_CACHED_BODIES:
+        _bodies.popitem(last=False)
+    return body
+
+
+def dumps(obj):
+    # byte-for-byte what Flask's jsonify sends outside debug mode
+    return (json.dumps(obj, separators=(",", ":"), sort_keys=True, default=str) + "\n").encode()
+
+
+# ----------------------
+# Queries (the same reads the Flask views make)
+# ----------------------
+async def match_innings(pool, match_id):
+    rows = await pool.fetchall(
+        f"SELECT {', '.join(INNINGS_COLUMNS)} FROM innings_aggregate WHERE match_id = ? ORDER BY id",
+        (match_id,))
+    return {str(r["batting_team_id"]): InningsAggregate(**dict(r)).to_dict() for r in rows}
+
+
+async def build_score(pool, match_id):
+    score, recent = await asyncio.gather(
+        match_innings(pool, match_id),
+        pool.fetchall("SELECT over, ball_in_over, striker_id, bowler_id, runs, extras, wicket, wicket_type "
+                      "FROM delivery WHERE match_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                      (match_id, RECENT_DELIVERIES)))
+    ids = sorted({pid for d in recent for pid in (d["striker_id"], d["bowler_id"]) if pid})
+    names = {}
+    if ids:
+        names = dict(await pool.fetchall(
+            f"SELECT id, name FROM player WHERE id IN ({', '.join('?' * len(ids))})", ids))
+    deliveries = [{
+        "over": d["over"],
+        "ball": d["ball_in_over"],
+        "batsman": names.get(d["striker_id"], "") if d["striker_id"] else "",
+        "bowler": names.get(d["bowler_id"], "") if d["bowler_id"] else "",
+        "runs": d["runs"],
+        "extras": d["extras"],
+        "wicket": bool(d["wicket"]) if d["wicket"] is not None else None,
+        "wicket_type": d["wicket_type"],
+    } for d in reversed(recent)]
+    return dumps({"status": "ok", "score": score, "deliveries": deliveries})
+
+
+async def points_table(pool, tid, version, standings_version):
+    # stored Standing rows while they are current; otherwise summed from the results
+    # (this side never writes, Flask rebuilds the stored table on its next read)
+    if standings_version == version:
+        rows = await pool.fetchall(
+            f"SELECT s.team_id, t.name, {', '.join('s.' + f for f in STANDING_FIELDS)} FROM standing s "
+            "JOIN team t ON t.id = s.team_id WHERE s.tournament_id = ? ORDER BY t.id", (tid,))
+        teams = [SimpleNamespace(id=r["team_id"], name=r["name"]) for r in rows]
+        stats = {r["team_id"]: {f: r[f] or 0 for f in STANDING_FIELDS} for r in rows}
+        return standings_rows(stats, teams)
+    teams = [SimpleNamespace(id=r["id"], name=r["name"]) for r in await pool.fetchall(
+        "SELECT id, name FROM team WHERE tournament_id = ? ORDER BY id", (tid,))]
+    stats = {}
+    for m in await pool.fetchall(
+            "SELECT played, teamA_id, teamB_id, a_runs, a_overs, b_runs, b_overs FROM match "
+            "WHERE tournament_id = ? AND played = 1", (tid,)):
+        add_contribution(stats, match_contribution(SimpleNamespace(**dict(m))))
+    return standings_rows(stats, teams)
+
+
+async def leaders(pool, tid, column):
+    # same order as leaders.leaders(tid, metric): value desc, then id desc
+    rows = await pool.fetchall(
+        f"SELECT {', '.join(PLAYER_COLUMNS)} FROM player WHERE tournament_id = ? AND {column} IS NOT NULL "
+        f"ORDER BY {column} DESC, id DESC LIMIT ?", (tid, LEADERS_LIMIT))
+    return [player_card(SimpleNamespace(**dict(r))) for r in rows]
+
+
+async def build_scoreboard(pool, tid, version, standings_version):
+    table, batsmen, bowlers = await asyncio.gather(
+        points_table(pool, tid, version, standings_version),
+        leaders(pool, tid, "runs"), leaders(pool, tid, "wickets"))
+    return dumps({
+        "status": "ok", "tournament_id": tid, "version": version, "points_table": table,
+        "batsmen": batsmen, "bowlers": bowlers,
+        "orange_cap": batsmen[0] if batsmen else None, "purple_cap": bowlers[0] if bowlers else None,
+    })
+
+
+# ----------------------
+# Live stream: one poller per match fans out to every viewer
+# ----------------------
+class Viewer:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+
+class MatchFeed:
+    def __init__(self, match_id, pool):
+        self.match_id = match_id
+        self.pool = pool
+        self.lock = asyncio.Lock()
+        self.viewers = set()
+        self.version = None
+        self.last_id = 0
+        self.task = None
+
+    async def snapshot(self):
+        score = await match_innings(self.pool, self.match_id)
+        return sse_message("score", {"match_id": self.match_id, "score": score}, self.last_id or None)
+
+    async def subscribe(self, last_event_id=None):
+        # returns (viewer, messages to send first)
+        async with self.lock:
+            if self.task is None or self.task.done():
+                row = await self.pool.fetchone(
+                    "SELECT m.version, (SELECT max(id) FROM delivery WHERE match_id = m.id) AS last_id "
+                    "FROM match m WHERE m.id = ?", (self.match_id,))
+                self.version, self.last_id = row["version"], row["last_id"] or 0
+                self.task = asyncio.ensure_future(self._poll())
+                _feeds[self.match_id] = self
+            viewer = Viewer()
+            self.viewers.add(viewer)
+        if last_event_id is not None and last_event_id <= self.last_id:
+            messages, _ = await self._deliveries_after(last_event_id, limit=BACKLOG_SIZE + 1)
+            if len(messages) <= BACKLOG_SIZE:
+                return viewer, messages
+        return viewer, [await self.snapshot()]
+
+    def unsubscribe(self, viewer):
+        self.viewers.discard(viewer)
+
+    async def _deliveries_after(self, after_id, limit=-1):
+        # -> (delivery messages, id of the last one)
+        rows = await self.pool.fetchall(
+            f"SELECT {', '.join(DELIVERY_COLUMNS)} FROM delivery WHERE match_id = ? AND id > ? "
+            "ORDER BY id LIMIT ?", (self.match_id, after_id, limit))
+        if not rows:
+            return [], after_id
+        innings = await match_innings(self.pool, self.match_id)
+        messages = [
+            sse_message("delivery", {"delivery": delivery_to_dict(d), "innings": innings.get(str(d.batting_team_id))}, d.id)
+            for d in (SimpleNamespace(**dict(r)) for r in rows)
+        ]
+        return messages, rows[-1]["id"]
+
+    async def _poll(self):
+        # one version check per interval for the whole audience; new balls only when it moved
+        try:
+            while self.viewers:
+                await asyncio.sleep(POLL_SECONDS)
+                version = await coalescer.run(("match_version", self.match_id),
+                                              lambda: _match_version(self.pool, self.match_id))
+                if version == self.version:
+                    continue
+                self.version = version
+                messages, self.last_id = await self._deliveries_after(self.last_id)
+                if not messages:
+                    # no new balls: a correction or a result, resend the whole score
+                    messages = [await self.snapshot()]
+                for viewer in list(self.viewers):
+                    for msg in messages:
+                        try:
+                            viewer.queue.put_nowait(msg)
+                        except asyncio.QueueFull:
+                            # slow client: cut it loose, it will reconnect with Last-Event-ID
+                            viewer.dropped = True
+                            self.viewers.discard(viewer)
+                            break
+        finally:
+            if _feeds.get(self.match_id) is self and not self.viewers:
+                del _feeds[self.match_id]
+
+
+_feeds = {}  # match_id -> MatchFeed
+
+
+async def _match_version(pool, match_id):
+    row = await pool.fetchone("SELECT version FROM match WHERE id = ?", (match_id,))
+    return row["version"] if row else None
+
+
+# ----------------------
+# ASGI plumbing
+# ----------------------
+async def respond(send, status, body=b"", headers=()):
+    headers = [*headers, ("Content-Length", str(len(body)))]
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.encode(), v.encode()) for k, v in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    for k, v in scope["headers"]:
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+
+def _cache_control():
+    return f"public, max-age={HTTP_CACHE_MAX_AGE}" if HTTP_CACHE_MAX_AGE else "public, no-cache"
+
+
+async def versioned_response(scope, send, route, key, version, build):
+    # the Flask versioned() contract: strong ETag from the data version, 304 on a match
+    args = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+    etag = f'"{route}-{key}-v{version}{query_tag(args)}-{ETAG_SALT}"'
+    headers = [("ETag", etag), ("Cache-Control", _cache_control())]
+    sent = _header(scope, b"if-none-match") or ""
+    if etag in (t.strip() for t in sent.split(",")) or sent.strip() == "*":
+        return await respond(send, 304, headers=headers)
+    body = await cached_body(route, key, version, build)
+    await respond(send, 200, body, [("Content-Type", "application/json")] + headers)
+
+
+async def score_view(scope, receive, send, match_id):
+    pool = await pool_for(tid_for_id(match_id))
+    version = await coalescer.run(("match_version", match_id), lambda: _match_version(pool, match_id))
+    if version is None:
+        # Flask answers an unknown match with an empty score, unversioned
+        body = await coalescer.run(("api_get_score", match_id, None), lambda: build_score(pool, match_id))
+        return await respond(send, 200, body, [("Content-Type", "application/json")])
+    await versioned_response(scope, send, "api_get_score", match_id, version,
+                             lambda: build_score(pool, match_id))
+
+
+async def scoreboard_view(scope, receive, send, tid):
+    pool = await pool_for(tid)
+    row = await coalescer.run(("tournament_version", tid), lambda: pool.fetchone(
+        "SELECT version, standings_version FROM tournament WHERE id = ?", (tid,)))
+    if row is None:
+        return await respond(send, 404, dumps({"status": "error", "message": "tournament not found"}),
+                             [("Content-Type", "application/json")])
+    version, standings_version = row["version"], row["standings_version"]
+    await versioned_response(scope, send, "spectator_scoreboard", tid, version,
+                             lambda: build_scoreboard(pool, tid, version, standings_version))
+
+
+async def stream_view(scope, receive, send, match_id):
+    pool = await pool_for(tid_for_id(match_id))
+    if await _match_version(pool, match_id) is None:
+        return await respond(send, 404, dumps({"status": "error", "message": "match not found"}),
+                             [("Content-Type", "application/json")])
+    last = _header(scope, b"last-event-id") or dict(
+        p.split("=", 1) for p in scope["query_string"].decode().split("&") if "=" in p).get("last_event_id")
+    last_event_id = int(last) if last and last.isdigit() else None
+
+    feed = _feeds.get(match_id)
+    if feed is None:
+        feed = _feeds[match_id] = MatchFeed(match_id, pool)
+    viewer, first = await feed.subscribe(last_event_id)
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+        for msg in first:
+            await send({"type": "http.response.body", "body": msg.encode(), "more_body": True})
+        while not disconnected.done() and not viewer.dropped:
+            getter = asyncio.ensure_future(viewer.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter not in done:
+                getter.cancel()
+                if not done:
+                    await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                continue
+            msg = getter.result()
+            await send({"type": "http.response.body", "body": msg.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass  # client went away mid-write
+    finally:
+        disconnected.cancel()
+        feed.unsubscribe(viewer)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def metric_lines():
+    streams = sum(len(f.viewers) for f in _feeds.values())
+    lines = [
+        "# TYPE crick_spectator_requests_coalesced_total counter",
+        f"crick_spectator_requests_coalesced_total {coalescer.shared}",
+        "# TYPE crick_spectator_reads_total counter",
+        f"crick_spectator_reads_total {coalescer.calls}",
+        "# TYPE crick_spectator_streams gauge",
+        f"crick_spectator_streams {streams}",
+        "# TYPE crick_spectator_feeds gauge",
+        f"crick_spectator_feeds {len(_feeds)}",
+        "# TYPE crick_spectator_connections gauge",
+    ]
+    lines += [f'crick_spectator_connections{{db="{os.path.basename(path)}"}} {pool.opened}'
+              for path, pool in sorted(_pools.items())]
+    return lines
+
+
+ROUTES = [
+    (re.compile(r"^/api/match/(\d+)/score$"), score_view),
+    (re.compile(r"^/api/match/(\d+)/stream$"), stream_view),
+    (re.compile(r"^/api/tournament/(\d+)/scoreboard$"), scoreboard_view),
+]
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for pool in _pools.values():
+                    await pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+    if scope["method"] not in ("GET", "HEAD"):
+        return await respond(send, 405, headers=[("Allow", "GET, HEAD")])
+    path = scope["path"]
+    if path == "/metrics":
+        return await respond(send, 200, ("\n".join(metric_lines()) + "\n").encode(),
+                             [("Content-Type", "text/plain; version=0.0.4")])
+    for pattern, view in ROUTES:
+        match = pattern.match(path)
+        if match:
+            return await view(scope, receive, send, int(match.group(1)))
+    await respond(send, 404, dumps({"status": "error", "message": "not found"}),
+                  [("Content-Type", "application/json")])
@@ -0,0 +1,107 @@
+# standings.py
+# Cached points table. Standing rows hold each team's running totals; record_match
+# applies just its own match's contribution, and readers serve the stored rows as
+# long as the tournament's standings_version matches its data version.
+from types import SimpleNamespace
+
+from models import db, Tournament, Team, Match, Standing
+from utils import (
+    STANDING_FIELDS, empty_standing, match_contribution, add_contribution, standings_rows
+)
+
+
+def bump_version(tid, standings_changed=True, match_id=None):
+    # every write route calls this; writes that cannot move the table keep the cache valid
+    if match_id is not None:
+        bump_match_version(match_id)
+    values = {"version": Tournament.version + 1}
+    if not standings_changed:
+        values["standings_version"] = db.case(
+            (Tournament.standings_version == Tournament.version, Tournament.version + 1),
+            else_=Tournament.standings_version,
+        )
+    db.session.execute(db.update(Tournament).where(Tournament.id == tid).values(**values))
+
+
+def tournament_version(tid):
+    # None for a tournament that does not exist
+    return db.session.execute(db.select(Tournament.version).where(Tournament.id == tid)).scalar()
+
+
+def bump_match_version(match_id):
+    db.session.execute(db.update(Match).where(Match.id == match_id).values(version=Match.version + 1))
+
+
+def match_snapshot(m):
+    # the fields match_contribution reads, captured before a form overwrites them,
+    # plus the version they were read at (record_match applies the result only if unchanged)
+    return SimpleNamespace(
+        version=m.version, played=m.played, teamA_id=m.teamA_id, teamB_id=m.teamB_id,
+        a_runs=m.a_runs, a_overs=m.a_overs, b_runs=m.b_runs, b_overs=m.b_overs,
+    )
+
+
+def apply_match_result(m, before):
+    # called inside record_match's transaction, after m has its new scores
+    tid = m.tournament_id
+    version, cached = db.session.query(Tournament.version, Tournament.standings_version) \
+        .filter(Tournament.id == tid).one()
+    if cached != version:
+        # cache already stale, the next reader rebuilds it
+        bump_version(tid)
+        return
+
+    delta = add_contribution({}, match_contribution(before), sign=-1)
+    add_contribution(delta, match_contribution(m))
+    for team_id, d in delta.items():
+        values = {f: getattr(Standing, f) + v for f, v in d.items() if v}
+        if values:
+            db.session.execute(db.update(Standing).where(
+                Standing.tournament_id == tid, Standing.team_id == team_id).values(**values))
+    db.session.execute(db.update(Tournament).where(Tournament.id == tid).values(
+        version=Tournament.version + 1, standings_version=Tournament.standings_version + 1))
+
+
+def rebuild_standings(tid):
+    teams = Team.query.filter_by(tournament_id=tid).order_by(Team.id).all()
+    stats = {t.id: empty_standing() for t in teams}
+    for m in Match.query.filter_by(tournament_id=tid, played=True).all():
+        add_contribution(stats, match_contribution(m))
+
+    version = db.session.query(Tournament.version).filter(Tournament.id == tid).scalar()
+    Standing.query.filter_by(tournament_id=tid).delete()
+    if teams:
+        db.session.execute(db.insert(Standing), [
+            dict(tournament_id=tid, team_id=t.id, **stats[t.id]) for t in teams
+        ])
+    # only mark the cache current if no writer moved the version meanwhile
+    db.session.execute(db.update(Tournament).where(
+        Tournament.id == tid, Tournament.version == version).values(standings_version=version))
+    db.session.commit()
+    return standings_rows(stats, teams)
+
+
+def _stored_stats(tid):
+    rows = db.session.query(Standing, Team.name).join(Team, Team.id == Standing.team_id) \
+        .filter(Standing.tournament_id == tid).order_by(Team.id).all()
+    stats = {s.team_id: {f: getattr(s, f) or 0 for f in STANDING_FIELDS} for s, _ in rows}
+    teams = [SimpleNamespace(id=s.team_id, name=name) for s, name in rows]
+    return teams, stats
+
+
+def standings_stats(tid):
+    # (teams, {team_id: {field: total}}), the raw totals behind the points table
+    version, cached = db.session.query(Tournament.version, Tournament.standings_version) \
+        .filter(Tournament.id == tid).one()
+    if cached != version:
+        rebuild_standings(tid)
+    return _stored_stats(tid)
+
+
+def points_table(tid):
+    version, cached = db.session.query(Tournament.version, Tournament.standings_version) \
+        .filter(Tournament.id == tid).one()
+    if cached != version:
+        return rebuild_standings(tid)
+    teams, stats = _stored_stats(tid)
+    return standings_rows(stats, teams)
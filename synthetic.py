@@ -0,0 +1,115 @@
+# synthetic.py
+# Generates a realistic, deterministic tournament (teams, players, played matches and
+# ball-by-ball Delivery rows) into the current app's database. Used by the
+# explain-report command and the benchmarks; everything goes in with bulk inserts.
+import math
+import random
+from datetime import datetime, timedelta
+from itertools import combinations
+from types import SimpleNamespace
+
+from models import db, Tournament, Team, Player, Match, Delivery
+from scoring import apply_delivery, add_stat_deltas, new_innings, PLAYER_STAT_FIELDS
+from utils import balls_to_overs
+
+BALLS_PER_INNINGS = 120
+
+
+def _innings(rng, match_id, over_clock, batting, bowling, batting_team_id, bowling_team_id):
+    # yields delivery dicts for one innings (20 overs or 10 wickets)
+    striker, non_striker, next_in = 0, 1, 2
+    wickets = legal = 0
+    while legal < BALLS_PER_INNINGS and wickets < 10:
+        over, ball = divmod(legal, 6)
+        bowler = bowling[-1 - (over % 5)]
+        roll = rng.random()
+        extras = "WD" if roll < 0.03 else "NB" if roll < 0.045 else ""
+        runs = 1 if extras == "WD" else rng.choices((0, 1, 2, 3, 4, 6), (35, 35, 10, 2, 12, 6))[0]
+        wicket = not extras and rng.random() < 0.045
+        yield {
+            "match_id": match_id, "over": over, "ball_in_over": ball + 1,
+            "batting_team_id": batting_team_id, "bowling_team_id": bowling_team_id,
+            "striker_id": batting[striker], "non_striker_id": batting[non_striker],
+            "bowler_id": bowler, "runs": 0 if wicket else runs, "extras": extras,
+            "wicket": wicket, "wicket_type": "bowled" if wicket else "",
+            "created_at": next(over_clock),
+        }
+        if extras:
+            continue
+        legal += 1
+        if wicket:
+            wickets += 1
+            striker, next_in = next_in, next_in + 1
+        elif runs % 2:
+            striker, non_striker = non_striker, striker
+        if legal % 6 == 0:
+            striker, non_striker = non_striker, striker
+
+
+def generate_tournament(teams=30, players_per_team=15, deliveries=100_000, name=None, seed=7):
+    if players_per_team < 11:
+        raise ValueError("need at least 11 players per team")
+    rng = random.Random(seed)
+    tour = Tournament(name=name or f"Synthetic {teams}x{players_per_team} ({deliveries} balls)")
+    db.session.add(tour)
+    db.session.flush()
+
+    db.session.execute(db.insert(Team), [
+        {"name": f"Team {i + 1}", "tournament_id": tour.id} for i in range(teams)
+    ])
+    team_ids = [tid for (tid,) in db.session.query(Team.id).filter_by(tournament_id=tour.id).order_by(Team.id)]
+    db.session.execute(db.insert(Player), [
+        {"name": f"Player {t}-{j + 1}", "team_id": t, "tournament_id": tour.id, "runs": 0, "balls_faced": 0,
+         "dismissals": 0, "wickets": 0, "balls_bowled": 0, "runs_conceded": 0}
+        for t in team_ids for j in range(players_per_team)
+    ])
+    roster = {}
+    for pid, tid in db.session.query(Player.id, Player.team_id).join(Team).filter(Team.tournament_id == tour.id):
+        roster.setdefault(tid, []).append(pid)
+
+    # enough fixtures (cycling the round robin) to reach the requested ball count
+    per_match = 2 * BALLS_PER_INNINGS
+    n_matches = max(1, math.ceil(deliveries / per_match))
+    pairs = list(combinations(team_ids, 2))
+    fixtures = [pairs[i % len(pairs)] for i in range(n_matches)]
+    db.session.execute(db.insert(Match), [
+        {"tournament_id": tour.id, "teamA_id": a, "teamB_id": b, "scheduled": f"Match {i + 1}"}
+        for i, (a, b) in enumerate(fixtures)
+    ])
+    match_ids = [mid for (mid,) in db.session.query(Match.id).filter_by(tournament_id=tour.id).order_by(Match.id)]
+
+    start = datetime(2024, 1, 1)
+    clock = (start + timedelta(seconds=20 * i) for i in range(10 ** 9))
+    stat_deltas = {}
+    total = 0
+    for mid, (a, b) in zip(match_ids, fixtures):
+        if total >= deliveries:
+            break
+        rows, sides = [], []
+        for bat, bowl in ((a, b), (b, a)):
+            innings = list(_innings(rng, mid, clock, roster[bat], roster[bowl], bat, bowl))
+            rows.extend(innings)
+            agg = new_innings(mid, bat, bowl)
+            for r in innings:
+                d = SimpleNamespace(id=None, **r)
+                apply_delivery(agg, d)
+                add_stat_deltas(stat_deltas, d)
+            sides.append(agg)
+        total += len(rows)
+        db.session.execute(db.insert(Delivery), rows)
+        db.session.add_all(sides)
+
+        A, B = sides
+        db.session.execute(db.update(Match).where(Match.id == mid).values(
+            played=True,
+            a_runs=A.runs, a_wickets=A.wickets, a_overs=balls_to_overs(A.legal_balls),
+            b_runs=B.runs, b_wickets=B.wickets, b_overs=balls_to_overs(B.legal_balls),
+            winner="A" if A.runs > B.runs else "B" if B.runs > A.runs else "tie",
+        ))
+
+    for pid, delta in stat_deltas.items():
+        db.session.execute(db.update(Player).where(Player.id == pid).values(
+            **{f: delta[f] for f in PLAYER_STAT_FIELDS}))
+    db.session.commit()
+    return {"tournament_id": tour.id, "teams": len(team_ids), "players": sum(map(len, roster.values())),
+            "matches": len(match_ids), "deliveries": total}
@@ -1,7 +1,7 @@
 import json
-from random import shuffle
-from itertools import combinations
-from math import floor
+import threading
+from collections import namedtuple
+from scheduler import fixture_pairs
 
 def overs_to_balls(overs):
     if not overs:
@@ -25,49 +25,64 @@ def balls_to_overs(balls):
     return f"{o}.{b}"
 
 
-def compute_points_and_nrr(matches, teams):
-    stats = {
-        t.id: {
-            "played": 0, "won": 0, "lost": 0, "tied": 0, "points": 0,
-            "runs_for": 0, "balls_faced": 0, "runs_against": 0, "balls_bowled": 0
-        } for t in teams
-    }
+STANDING_FIELDS = (
+    "played", "won", "lost", "tied", "points",
+    "runs_for", "balls_faced", "runs_against", "balls_bowled"
+)
 
-    for m in matches:
-        if not m.played:
-            continue
-
-        A = m.teamA_id
-        B = m.teamB_id
-        a_runs = int(m.a_runs or 0)
-        b_runs = int(m.b_runs or 0)
-        a_balls = overs_to_balls(m.a_overs)
-        b_balls = overs_to_balls(m.b_overs)
-
-        stats[A]["played"] += 1
-        stats[B]["played"] += 1
-
-        stats[A]["runs_for"] += a_runs
-        stats[A]["balls_faced"] += a_balls
-        stats[A]["runs_against"] += b_runs
-        stats[A]["balls_bowled"] += b_balls
-
-        stats[B]["runs_for"] += b_runs
-        stats[B]["balls_faced"] += b_balls
-        stats[B]["runs_against"] += a_runs
-        stats[B]["balls_bowled"] += a_balls
-
-        if a_runs > b_runs:
-            stats[A]["won"] += 1; stats[B]["lost"] += 1; stats[A]["points"] += 2
-        elif b_runs > a_runs:
-            stats[B]["won"] += 1; stats[A]["lost"] += 1; stats[B]["points"] += 2
-        else:
-            stats[A]["tied"] += 1; stats[B]["tied"] += 1
-            stats[A]["points"] += 1; stats[B]["points"] += 1
 
+def empty_standing():
+    return dict.fromkeys(STANDING_FIELDS, 0)
+
+
+def match_contribution(m):
+    # {team_id: {field: delta}} for one played match; {} if not played
+    if not m.played:
+        return {}
+
+    A = m.teamA_id
+    B = m.teamB_id
+    a_runs = int(m.a_runs or 0)
+    b_runs = int(m.b_runs or 0)
+    a_balls = overs_to_balls(m.a_overs)
+    b_balls = overs_to_balls(m.b_overs)
+
+    sa, sb = empty_standing(), empty_standing()
+    sa["played"] = sb["played"] = 1
+
+    sa["runs_for"] += a_runs
+    sa["balls_faced"] += a_balls
+    sa["runs_against"] += b_runs
+    sa["balls_bowled"] += b_balls
+
+    sb["runs_for"] += b_runs
+    sb["balls_faced"] += b_balls
+    sb["runs_against"] += a_runs
+    sb["balls_bowled"] += a_balls
+
+    if a_runs > b_runs:
+        sa["won"] += 1; sb["lost"] += 1; sa["points"] += 2
+    elif b_runs > a_runs:
+        sb["won"] += 1; sa["lost"] += 1; sb["points"] += 2
+    else:
+        sa["tied"] += 1; sb["tied"] += 1
+        sa["points"] += 1; sb["points"] += 1
+    return {A: sa, B: sb}
+
+
+def add_contribution(stats, contribution, sign=1):
+    for team_id, delta in contribution.items():
+        st = stats.setdefault(team_id, empty_standing())
+        for k, v in delta.items():
+            st[k] += sign * v
+    return stats
+
+
+def standings_rows(stats, teams):
+    # teams: iterable of objects with .id and .name
     rows = []
     for t in teams:
-        st = stats[t.id]
+        st = stats.get(t.id) or empty_standing()
         rf, bf = st["runs_for"], st["balls_faced"]
         ra, bb = st["runs_against"], st["balls_bowled"]
         rpo = (rf / (bf / 6)) if bf > 0 else 0
@@ -82,35 +97,28 @@ def compute_points_and_nrr(matches, teams):
             "lost": st["lost"],
             "tied": st["tied"],
             "points": st["points"],
+            "runs_for": rf,
+            "runs_against": ra,
             "nrr": nrr
         })
 
     return sorted(rows, key=lambda row: (row["points"], row["nrr"]), reverse=True)
 
 
+def compute_points_and_nrr(matches, teams):
+    stats = {t.id: empty_standing() for t in teams}
+    for m in matches:
+        add_contribution(stats, match_contribution(m))
+    return standings_rows(stats, teams)
+
+
 def simple_scheduler(team_ids, matches_per_team=3):
-    s = []
-    counts = {t: 0 for t in team_ids}
-    pool = team_ids[:]
-
-    for _ in range(500):
-        shuffle(pool)
-        for i in range(len(pool) - 1):
-            a, b = pool[i], pool[i+1]
-            if a == b:
-                continue
-            if counts[a] < matches_per_team and counts[b] < matches_per_team:
-                key = tuple(sorted((a, b)))
-                if key not in {tuple(sorted(p)) for p in s}:
-                    s.append((a, b))
-                    counts[a] += 1
-                    counts[b] += 1
-
-    return s
+    # kept for callers that only need pairs; see scheduler.py for rounds/days/venues
+    return fixture_pairs(team_ids, matches_per_team)
 
 
 # ---- Import models now (to avoid circular import earlier) ----
-from models import Player, Delivery
+from models import db, Team, Player, Delivery, Match
 
 
 def top_batsmen_for_team(team_id, limit=5):
@@ -118,9 +126,10 @@ def top_batsmen_for_team(team_id, limit=5):
 
 
 def top_bowlers_for_team(team_id, limit=5):
-    players = Player.query.filter_by(team_id=team_id).all()
-    players_sorted = sorted(players, key=lambda p: (-p.wickets, p.bowling_economy()))
-    return players_sorted[:limit]
+    # most wickets, then cheapest economy (players who have not bowled last)
+    return Player.query.filter_by(team_id=team_id) \
+        .order_by(Player.wickets.desc(), Player.economy.is_(None), Player.economy.asc()) \
+        .limit(limit).all()
 
 
 def match_score_summary(match_id):
@@ -141,3 +150,53 @@ def match_score_summary(match_id):
         v["overs"] = f"{balls // 6}.{balls % 6}"
 
     return {"totals": totals, "deliveries": deliveries}
+
+
+# ---- Roster cache: player names for both sides of a match ----
+# Filled on first use per match and tagged with both teams' roster_version; every
+# use re-reads those two versions (one primary-key lookup), so a player added or a
+# team deleted in another worker reloads the entry there too.
+RosterEntry = namedtuple("RosterEntry", "id name team_id is_keeper is_captain")
+
+_roster_cache = {}  # match_id -> {"teams": (teamA_id, teamB_id), "versions": {team_id: v}, "players": {...}}
+_roster_lock = threading.Lock()
+
+
+def _roster_versions(team_ids):
+    return dict(db.session.query(Team.id, Team.roster_version).filter(Team.id.in_([t for t in team_ids if t])))
+
+
+def match_roster(match_id):
+    entry = _roster_cache.get(match_id)
+    if entry is not None and _roster_versions(entry["teams"]) == entry["versions"]:
+        return entry
+    teams = db.session.query(Match.teamA_id, Match.teamB_id).filter(Match.id == match_id).first()
+    if teams is None:
+        return None
+    versions = _roster_versions(teams)
+    rows = db.session.query(
+        Player.id, Player.name, Player.team_id, Player.is_keeper, Player.is_captain
+    ).filter(Player.team_id.in_([t for t in teams if t])).order_by(Player.id).all()
+    entry = {"teams": tuple(teams), "versions": versions, "players": {r.id: RosterEntry(*r) for r in rows}}
+    with _roster_lock:
+        _roster_cache[match_id] = entry
+    return entry
+
+
+def roster_names(match_id, player_ids=()):
+    # {player_id: name}; ids from outside both rosters (e.g. substitutes) cost one extra query
+    entry = match_roster(match_id)
+    names = {pid: p.name for pid, p in entry["players"].items()} if entry else {}
+    missing = {pid for pid in player_ids if pid and pid not in names}
+    if missing:
+        names.update(db.session.query(Player.id, Player.name).filter(Player.id.in_(missing)).all())
+    return names
+
+
+def invalidate_roster(team_id=None):
+    with _roster_lock:
+        if team_id is None:
+            _roster_cache.clear()
+            return
+        for mid in [mid for mid, e in _roster_cache.items() if team_id in e["teams"]]:
+            _roster_cache.pop(mid, None)
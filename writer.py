@@ -0,0 +1,103 @@
+# writer.py
+# Write-behind queue for live scoring. In production DB mode every delivery write is
+# handed to one writer thread, which drains whatever has queued up (waiting at most
+# WRITE_BEHIND_MS for more) and runs it all in a single transaction: one fsync for a
+# burst of balls instead of one per request, and no writer-vs-writer lock contention.
+# The request thread waits for its own result, so a 200 still means "committed".
+# If a group fails, it is rolled back and replayed one item per transaction so a bad
+# item only fails its own request. With per-tournament shards each group is split
+# by shard, so one transaction never spans two database files.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models import db, shard_engine, bind_shard
+
+
+class WriteQueue:
+    def __init__(self, app, enabled=False, interval=0.005, max_batch=256):
+        self.app = app
+        self.enabled = enabled
+        self.interval = interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self._thread = None
+        self.groups = 0
+        self.items = 0
+
+    def run(self, fn):
+        # fn() does the writes in the current session and returns plain data (the
+        # session is committed after it, which expires ORM instances)
+        if not self.enabled:
+            try:
+                result = fn()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return result
+        future = Future()
+        self._start()
+        # fn runs on the writer thread against the caller's tournament shard
+        self.queue.put((bind_shard(fn), future, shard_engine.get()))
+        return future.result()
+
+    def _start(self):
+        # started on first use so importing the app starts no threads
+        with self.lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def _drain(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            groups = {}
+            for fn, future, shard in self._drain():
+                groups.setdefault(shard, []).append((fn, future))
+            for batch in groups.values():
+                with self.app.app_context():
+                    try:
+                        self._commit_group(batch)
+                    finally:
+                        db.session.remove()
+
+    def _commit_group(self, batch):
+        try:
+            results = [fn() for fn, _ in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                for item in batch:
+                    self._commit_group([item])
+            return
+        self.groups += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def metric_lines(self):
+        return [
+            "# TYPE crick_write_queue_groups_total counter",
+            f"crick_write_queue_groups_total {self.groups}",
+            "# TYPE crick_write_queue_items_total counter",
+            f"crick_write_queue_items_total {self.items}",
+            "# TYPE crick_write_queue_depth gauge",
+            f"crick_write_queue_depth {self.queue.qsize()}",
+        ]
+